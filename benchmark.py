@@ -0,0 +1,265 @@
+# ==========================================
+# [오프라인 벤치마크] 구글 계정 없이 화면/동작별 시간과 시트 API 호출 수를 잰다
+#   python benchmark.py                       -> 50/500/5000명, 지연 없음
+#   python benchmark.py --sizes 500 --latency 0.2 --json bench.json
+#   python benchmark.py --profile             -> pandas 안에서 쓴 시간도 (프로파일러 때문에 느려져서 시간 예산은 안 봄)
+# 예산(BUDGETS)을 넘는 항목이 있으면 종료 코드 1
+# ==========================================
+import argparse
+import collections
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+import gspread
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP = "streamlit_app.py"
+FLUSH_WAIT = 1.0  # 초: 동작 후 쓰기 큐가 백그라운드로 반영될 때까지 기다림 (API 호출 수에 포함)
+PAGES = ["🏠 홈 대시보드", "🚍 차량 운행표", "📝 수련부 출석", "📞 학부모 상담", "📉 오늘의 결석자", "🧠 기질/훈육 통합", "📈 승급심사 관리", "🎂 이달의 생일", "🔐 관리자 모드"]
+
+# 동작별 예산: API 호출 수 / 화면 시간(ms, 명단 크기별). 쓰기 동작 = 쓰기 한 번 (+ 스냅샷과 다를 때만 비교용 읽기 또는 증분 동기화 1회)
+PAGE_BUDGET = {"calls": 2, "ms": {50: 1500, 500: 2000, 5000: 6000}}
+BUDGETS = {
+    "첫 접속": {"calls": 12, "ms": {50: 3000, 500: 4000, 5000: 12000}},
+    "탑승": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "출석": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "결석처리": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "정류장 전원 탑승": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "반 전체 출석": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "일괄 되돌리기": {"calls": 2, "ms": {50: 1000, 500: 1500, 5000: 5000}},
+    "장기일정 저장": {"calls": 2, "ms": {50: 2000, 500: 2500, 5000: 6000}},  # 앱이 저장 후 1초 보여줌
+    "마감": {"calls": 4, "ms": {50: 2000, 500: 3000, 5000: 10000}},
+}
+
+# [가짜 gspread] 메모리 안의 시트 + 호출 수 집계 + 호출마다 지연 (구글 계정 없이 돌려 볼 때 쓰는 유일한 가짜, 앱은 gspread.authorize 만 바꿔 끼움)
+class FakeWorksheet:
+    def __init__(self, client, title, rows):
+        self.client = client
+        self.title = title
+        self.rows = [list(r) for r in rows]
+
+    def _bounds(self, a1):
+        g = gspread.utils.a1_range_to_grid_range(a1)
+        width = max([len(r) for r in self.rows] or [0])
+        return (g.get('startRowIndex', 0) + 1, g.get('startColumnIndex', 0) + 1,
+                g.get('endRowIndex', len(self.rows)), g.get('endColumnIndex', width))
+
+    def _get(self, a1):
+        r1, c1, r2, c2 = self._bounds(a1)
+        out = [[row[c - 1] if c <= len(row) else '' for c in range(c1, c2 + 1)] for row in self.rows[r1 - 1:r2]]
+        while out and not any(out[-1]): out.pop()
+        return out
+
+    def _write(self, a1, values):
+        r1, c1, _, _ = self._bounds(a1)
+        for i, vals in enumerate(values):
+            while len(self.rows) < r1 + i: self.rows.append([])
+            row = self.rows[r1 + i - 1]
+            for j, v in enumerate(vals):
+                row.extend([''] * (c1 + j - len(row)))
+                row[c1 + j - 1] = v
+
+    def get_all_values(self):
+        self.client.call("get_all_values")
+        width = max([len(r) for r in self.rows] or [0])
+        return [r + [''] * (width - len(r)) for r in self.rows]
+
+    def get(self, a1):
+        self.client.call("get")
+        return self._get(a1)
+
+    def batch_get(self, ranges):
+        self.client.call("batch_get")
+        return [self._get(a1) for a1 in ranges]
+
+    def batch_update(self, data, **kwargs):
+        self.client.call("batch_update")
+        for d in data: self._write(d['range'], d['values'])
+
+    def append_row(self, values, **kwargs):
+        self.client.call("append_row")
+        self.rows.append(list(values))
+        n = len(self.rows)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{n}:{gspread.utils.rowcol_to_a1(n, max(len(values), 1))}", "updatedRows": 1}}
+
+    def batch_clear(self, ranges):
+        self.client.call("batch_clear")
+        for a1 in ranges:
+            r1, c1, r2, c2 = self._bounds(a1)
+            self._write(f"{gspread.utils.rowcol_to_a1(r1, c1)}", [[''] * (c2 - c1 + 1)] * max(0, min(r2, len(self.rows)) - r1 + 1))
+
+class FakeSpreadsheet:
+    def __init__(self, client, sheets):
+        self.client = client
+        self.sheets = {name: FakeWorksheet(client, name, rows) for name, rows in sheets.items()}
+
+    def worksheet(self, title):
+        self.client.call("worksheet")
+        if title not in self.sheets: raise gspread.exceptions.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def _split(self, a1):
+        name, _, rng = a1.partition('!')
+        return self.sheets[name.strip("'")], rng
+
+    def values_batch_get(self, ranges, params=None):
+        self.client.call("values_batch_get")
+        out = []
+        for a1 in ranges:
+            ws, rng = self._split(a1)
+            out.append({'range': a1, 'values': ws._get(rng) if rng else [list(r) for r in ws.rows]})
+        return {'valueRanges': out}
+
+    def values_batch_update(self, body):
+        self.client.call("values_batch_update")
+        for d in body['data']:
+            ws, rng = self._split(d['range'])
+            ws._write(rng, d['values'])
+
+class FakeClient:
+    def __init__(self, sheets, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.book = FakeSpreadsheet(self, sheets)
+
+    def call(self, name):
+        self.calls[name] += 1
+        if self.latency: time.sleep(self.latency)
+
+    def open_by_key(self, key):
+        self.call("open_by_key")
+        return self.book
+
+ROSTER_HEAD = ['이름', '수련부', '상태', '등원요일', '등원차량', '등원시간', '등원장소', '하원차량', '하원시간', '하원장소',
+               '차량이용여부', '등원확인', '하원확인', '출석확인', '비고', '장기일정', '생일', '기질유형']
+
+def make_sheets(n, seed=1):
+    # 합성 명단: 동명이인, 요일별 차량, 장기일정(지난/진행 중)이 섞이도록
+    rnd = random.Random(seed)
+    family, given = "김이박최정강조윤장임", ["지안", "서준", "하윤", "도윤", "민서", "예준", "서연", "시우"]
+    rows = [ROSTER_HEAD]
+    for i in range(n):
+        name = rnd.choice(family) + rnd.choice(given) + (str(i) if i % 5 else '')
+        schedule = '2000-01-01~2099-12-31:방학' if i % 17 == 0 else ('2020-01-01~2020-01-05:여행' if i % 7 == 0 else '')
+        rows.append([name, rnd.choice(['1', '2', '3', '4', '5']), '재원', '' if i % 3 else '월수금',
+                     '1호차(월수금),2호차(화목토일)' if i % 2 else f'{i % 4 + 1}호차', f'{13 + i % 4}:00', f'정류장{i % 9}',
+                     f'{i % 3 + 1}호차', f'{17 + i % 3}:00', f'정류장{i % 7}', 'O', '', '', '', '', schedule,
+                     f'2015{i % 12 + 1:02d}{i % 28 + 1:02d}', 'A'])
+    return {
+        '원생명단': rows,
+        '공지사항': [['날짜', '내용'], ['2026-01-01', '[상담] 공지']],
+        '기질가이드': [['기질유형', '지도_DO(해라)', '지도_DONT(하지마라)', '훈육_스크립트'], ['A', '칭찬', '비난', '스크립트']],
+        '심사일정': [['날짜', '이름'], ['2026.01.01', rows[1][0]]],
+        '상담일지': [['날짜', '이름', '내용']] + [['2026-01-01', rows[1 + i % n][0], '상담']] * (n // 5),
+        '월간출석부': [['이름']],
+    }
+
+# [동작] 준비(측정 안 함) -> 측정할 동작
+def click(at, label, prefix=False):
+    [b for b in at.button if (b.label.startswith(label) if prefix else b.label == label)][0].click().run()
+
+def prepare_cards(at):
+    at.sidebar.radio[0].set_value("📝 수련부 출석").run()
+    table = [t for t in at.toggle if t.label == "📋 표로 보기"]
+    if table and table[0].value: table[0].set_value(False).run()
+
+ACTIONS = [
+    ("탑승", lambda at: at.sidebar.radio[0].set_value("🚍 차량 운행표").run(), lambda at: click(at, "탑승")),
+    ("출석", prepare_cards, lambda at: [c for c in at.checkbox if c.label == "출석확인" and not c.value][0].check().run()),
+    ("결석처리", prepare_cards, lambda at: click(at, "결석처리")),
+    ("정류장 전원 탑승", lambda at: at.sidebar.radio[0].set_value("🚍 차량 운행표").run(), lambda at: click(at, "🚌 ", True)),
+    ("반 전체 출석", prepare_cards, lambda at: click(at, "✅ 남은", True)),
+    ("일괄 되돌리기", prepare_cards, lambda at: click(at, "↩️ 되돌리기", True)),
+    ("장기일정 저장", lambda at: (prepare_cards(at), click(at, "🔽 특이사항 / 장기 일정 등록")), lambda at: click(at, "저장")),
+    ("마감", lambda at: (at.sidebar.radio[0].set_value("🔐 관리자 모드").run(), [t for t in at.text_input if t.label == "PW"][0].input("0577").run()),
+     lambda at: click(at, "🔥 마감 및 저장")),
+]
+
+def measure(client, at, fn, wait, profile=False):
+    # 화면 시간(ms), 그동안 + 백그라운드 반영까지의 API 호출, pandas 안에서 쓴 시간(ms)
+    # AppTest 는 스크립트를 새 스레드에서 돌리므로 새로 뜨는 스레드마다 프로파일러를 붙임
+    profilers = []
+    def attach(*_):
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+    before = collections.Counter(client.calls)
+    if profile: threading.setprofile(attach)
+    start = time.perf_counter()
+    try: fn(at)
+    finally: threading.setprofile(None)
+    ms = (time.perf_counter() - start) * 1000
+    if wait: time.sleep(FLUSH_WAIT)
+    pandas_ms = 0.0
+    for profiler in profilers:
+        stats = pstats.Stats(profiler).stats
+        pandas_ms += sum(tt for (path, _, _), (_, _, tt, _, _) in stats.items() if "/pandas/" in path) * 1000
+    calls = client.calls - before
+    errors = [e.value for e in at.exception]
+    return {"ms": round(ms, 1), "pandas_ms": round(pandas_ms, 1) if profile else None, "calls": sum(calls.values()), "by_call": dict(calls), "errors": errors}
+
+def run_size(n, latency, profile):
+    # 캐시(저장소 싱글턴, 명단 스냅샷 등)는 프로세스 전체 공유 -> 크기마다 비우고 새 가짜 시트로
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    client = FakeClient(make_sheets(n), latency)
+    results = []
+    with tempfile.TemporaryDirectory() as local_dir, \
+            mock.patch("gspread.authorize", return_value=client), \
+            mock.patch("google.oauth2.service_account.Credentials.from_service_account_info", return_value=object()):
+        at = AppTest.from_file(APP, default_timeout=600)
+        at.secrets["gcp_service_account"] = {}
+        # 로컬 파일(출석 이력, 쓰기 저널, 디스크 스냅샷)은 실행마다 새로: 지난 실행의 저널이 재생되지 않게
+        at.secrets["attendance_history_dir"] = os.path.join(local_dir, "attendance_history")
+        at.secrets["journal_path"] = os.path.join(local_dir, "journal.db")
+        at.secrets["snapshot_path"] = os.path.join(local_dir, "snapshot.json")
+        results.append(("첫 접속", measure(client, at, lambda at: at.run(), True, profile)))
+        for page in PAGES:
+            results.append((f"화면: {page}", measure(client, at, lambda at: at.sidebar.radio[0].set_value(page).run(), False, profile)))
+        for name, prepare, action in ACTIONS:
+            prepare(at)
+            results.append((name, measure(client, at, action, True, profile)))
+    return results
+
+def check_budget(name, n, result, profile):
+    budget = PAGE_BUDGET if name.startswith("화면: ") else BUDGETS[name]
+    over = []
+    if result["errors"]: over.append("오류")
+    if result["calls"] > budget["calls"]: over.append(f"API {result['calls']} > {budget['calls']}")
+    limit = budget["ms"][max([k for k in budget["ms"] if k <= n] or [min(budget["ms"])])]  # n 이하에서 가장 큰 명단 크기의 예산
+    if not profile and result["ms"] > limit: over.append(f"{result['ms']:.0f}ms > {limit}ms")
+    return over
+
+def main():
+    parser = argparse.ArgumentParser(description="화면/동작별 시간과 시트 API 호출 수 측정")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--latency", type=float, default=0.0, help="가짜 시트 API 호출마다 넣을 지연(초)")
+    parser.add_argument("--profile", action="store_true", help="pandas 안에서 쓴 시간 측정 (시간 예산은 확인 안 함)")
+    parser.add_argument("--json", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    report, failed = [], False
+    for n in args.sizes:
+        print(f"\n== 원생 {n}명 (지연 {args.latency}s) ==")
+        print(f"{'항목':<22}{'시간ms':>9}{'pandas':>9}{'API':>5}  호출 내역")
+        for name, result in run_size(n, args.latency, args.profile):
+            over = check_budget(name, n, result, args.profile)
+            failed = failed or bool(over)
+            print(f"{name:<22}{result['ms']:>9.0f}{'-' if result['pandas_ms'] is None else round(result['pandas_ms']):>9}{result['calls']:>5}  {result['by_call'] or ''}"
+                  + (f"  ❌ {', '.join(over)}" if over else ""))
+            report.append({"size": n, "latency": args.latency, "name": name, **result, "over_budget": over})
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=1)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,28 @@ import streamlit as st
 import pandas as pd
 import gspread
 from google.oauth2.service_account import Credentials
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from datetime import datetime, timedelta
 import time
-import re
+import os
+import threading
+import sqlite3
+import collections
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import json
+import io
+import csv
+import bisect
+import functools
+import abc
+from google.auth.transport.requests import AuthorizedSession
+from google.auth.exceptions import TransportError, RefreshError
+from requests.adapters import HTTPAdapter
 
 # ==========================================
 # [설정] 구글 시트 연동
@@ -13,6 +32,31 @@ SHEET_ID = "1fFNQQgYJfUzV-3qAdaFEeQt1OKBOJibASHQmeoW2nqo"
 
 st.set_page_config(page_title="로운태권도 통합 관제실", page_icon="🥋", layout="wide")
 
+def get_setting(name, default):
+    # secrets.toml 이 없거나 키가 없으면 기본값
+    try: return st.secrets.get(name, default)
+    except Exception: return default
+
+# 지점: {지점 이름: 시트 ID}. 세션마다 사이드바에서 고르고, 저장소/캐시/쓰기 큐/API 한도는 지점마다 따로
+# (secrets.toml 에 [branches] 가 없으면 본점 하나). 첫 지점은 예전 로컬 파일 경로를 그대로 씀
+BRANCHES = dict(get_setting("branches", {})) or {"본점": SHEET_ID}
+DEFAULT_BRANCH = next(iter(BRANCHES))
+CLIENT_POOL_SIZE = max(10, 4 * len(BRANCHES))  # 모든 지점이 같이 쓰는 인증된 클라이언트의 HTTP 연결 수
+
+# 저장소: sheets(구글 시트) | sqlite(로컬 단독) | replica(로컬에서 읽고 시트로 백그라운드 전송)
+STORAGE_BACKEND = get_setting("storage_backend", "sheets")
+SQLITE_PATH = get_setting("sqlite_path", "roun_local.db")
+REPLICA_REFRESH_SEC = 5
+ATTENDANCE_HISTORY_DIR = get_setting("attendance_history_dir", "attendance_history")
+JOURNAL_PATH = get_setting("journal_path", "roun_journal.db")          # 시트에 보내기 전 모든 변경을 먼저 남기는 로컬 저널
+SNAPSHOT_PATH = get_setting("snapshot_path", "roun_snapshot.json")    # 마지막으로 읽은 시트 내용 (오프라인일 때 화면용)
+MAX_STALE_SEC = get_setting("max_stale_sec", 30)  # 갱신 주기가 지나도 이 초까지는 이전 스냅샷을 바로 보여 주고 뒤에서 새로 받음 (넘으면 기다림)
+LIVE_INTERVALS = [5, 10, 30, 60]  # 실시간 모드 갱신 주기 선택지 (초)
+LIVE_DEFAULT_INTERVAL = 10
+ROSTER_PAGE_SIZE = 15  # 카드 화면 한 페이지 인원 (보이는 카드만 위젯을 만듦)
+ROSTER_TABLE_AUTO = 40  # 대상이 이보다 많으면 처음부터 표로 보기
+RENDER_BUDGET_MS = 500  # 원생 500명 기준 한 구역 화면 구성 목표
+
 # [디자인 강제 고정]
 st.markdown("""
     <style>
@@ -29,6 +73,138 @@ st.markdown("""
 def get_korea_time():
     return datetime.utcnow() + timedelta(hours=9)
 
+# ==========================================
+# [성능 계측] 시트 호출 / 캐시 적중 / 구간별 시간을 모아서 관리자 탭에서 보여줌
+# ==========================================
+METRICS_KEEP = 2000  # 항목당 보관할 최근 측정 수
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=METRICS_KEEP))  # 이름 -> [ms]
+        self.events = collections.deque(maxlen=METRICS_KEEP * 10)  # (시각, 종류, 이름, ms) 내보내기용
+        self.cache = collections.defaultdict(collections.Counter)  # 캐시 이름 -> hit / miss
+        self.runs = collections.deque(maxlen=100)  # 실행(전체 또는 구역) 한 번의 구간별 시간
+        self._run = contextvars.ContextVar("metrics_run", default=None)
+
+    def record(self, kind, name, ms):
+        run = self._run.get()
+        with self._lock:
+            self.samples[name].append(ms)
+            self.events.append((time.time(), kind, name, round(ms, 2)))
+            if run is not None: run["parts"][name] += ms
+
+    @contextlib.contextmanager
+    def timer(self, name, kind="code"):
+        start = time.perf_counter()
+        try: yield
+        finally: self.record(kind, name, (time.perf_counter() - start) * 1000)
+
+    def cache_result(self, name, hit):
+        with self._lock:
+            self.cache[name]["hit" if hit else "miss"] += 1
+            self.events.append((time.time(), "cache_hit" if hit else "cache_miss", name, 0.0))
+
+    def in_run(self): return self._run.get() is not None
+
+    def begin_run(self, label):
+        run = {"time": time.time(), "label": label, "start": time.perf_counter(), "parts": collections.defaultdict(float)}
+        return run, self._run.set(run)
+
+    def end_run(self, run, token, label=None):
+        self._run.reset(token)
+        total = (time.perf_counter() - run["start"]) * 1000
+        with self._lock:
+            self.runs.append({"time": run["time"], "label": label or run["label"], "total_ms": round(total, 1),
+                              "parts": {k: round(v, 1) for k, v in run["parts"].items()}})
+        self.record("run", f"실행:{label or run['label']}", total)
+
+    def api_per_minute(self, minutes=30):
+        now = time.time()
+        with self._lock: stamps = [t for t, kind, _, _ in self.events if kind == "api" and now - t < minutes * 60]
+        counts = collections.Counter(int((now - t) // 60) for t in stamps)
+        return pd.Series([counts.get(m, 0) for m in range(minutes - 1, -1, -1)], index=[f"-{m}분" for m in range(minutes - 1, -1, -1)])
+
+    def summary(self):
+        with self._lock: samples = {name: list(v) for name, v in self.samples.items()}
+        rows = [{"항목": name, "횟수": len(v), "p50(ms)": round(float(pd.Series(v).quantile(0.5)), 1),
+                 "p95(ms)": round(float(pd.Series(v).quantile(0.95)), 1), "최대(ms)": round(max(v), 1)} for name, v in samples.items() if v]
+        return pd.DataFrame(rows).sort_values("p95(ms)", ascending=False) if rows else pd.DataFrame()
+
+    def cache_ratios(self):
+        with self._lock: cache = {name: dict(c) for name, c in self.cache.items()}
+        rows = [{"캐시": name, "적중": c.get("hit", 0), "실패": c.get("miss", 0),
+                 "적중률(%)": round(c.get("hit", 0) / max(1, c.get("hit", 0) + c.get("miss", 0)) * 100, 1)} for name, c in cache.items()]
+        return pd.DataFrame(rows)
+
+    def export_json(self):
+        with self._lock:
+            data = {"runs": list(self.runs), "events": [list(e) for e in self.events], "cache": {k: dict(v) for k, v in self.cache.items()}}
+        return json.dumps(data, ensure_ascii=False)
+
+    def export_csv(self):
+        with self._lock: events = list(self.events)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["time", "kind", "name", "ms"])
+        writer.writerows(events)
+        return out.getvalue()
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear(); self.events.clear(); self.cache.clear(); self.runs.clear()
+
+@st.cache_resource
+def get_metrics():
+    return Metrics()
+
+# [지점] 이번 실행(과 그 안에서 띄운 스레드)이 어느 지점 것인지. 지점별 싱글턴은 branch_resource 로
+current_branch = contextvars.ContextVar("current_branch", default=DEFAULT_BRANCH)
+
+def use_session_branch():
+    # 전체 실행/구역 재실행 시작마다 세션에서 고른 지점으로
+    branch = st.session_state.get("branch", DEFAULT_BRANCH)
+    current_branch.set(branch if branch in BRANCHES else DEFAULT_BRANCH)
+
+def current_session_id():
+    # 변경을 만든 세션 (실패/충돌 알림은 그 세션에만). 스크립트 밖(백그라운드, 저널 재생)이면 None
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+def start_branch_thread(fn, *args):
+    # 백그라운드 스레드: 지점만 이어받음 (실행 계측/API 우선순위는 물려주지 않음)
+    branch = current_branch.get()
+    def run():
+        current_branch.set(branch)
+        fn(*args)
+    threading.Thread(target=run, daemon=True).start()
+
+def branch_path(path):
+    # 지점별 로컬 파일/폴더: 첫 지점은 그대로, 나머지는 이름 뒤에 _지점
+    branch = current_branch.get()
+    if branch == DEFAULT_BRANCH: return path
+    root, ext = os.path.splitext(path)
+    return f"{root}_{branch}{ext}"
+
+@st.cache_resource
+def _branch_registry():
+    # 지점 -> {싱글턴 이름: 이미 만든 객체}. 만들지 않고 들여다볼 때 (지점 현황 등)
+    return collections.defaultdict(dict)
+
+@st.cache_resource
+def _branch_singleton(name, branch, _factory):
+    resource = _factory()
+    _branch_registry()[branch][name] = resource
+    return resource
+
+def branch_resource(factory):
+    # cache_resource 를 지점 이름으로 나눈 싱글턴 (만들 때도 그 지점 컨텍스트 안에서 만듦)
+    # get.peek(지점): 그 지점에서 이미 만들어졌으면 그 객체, 아니면 None (새로 만들지 않음)
+    @functools.wraps(factory)
+    def get(): return _branch_singleton(factory.__name__, current_branch.get(), factory)
+    get.peek = lambda branch: _branch_registry()[branch].get(factory.__name__)
+    return get
+
 @st.cache_resource
 def get_gspread_client():
     try:
@@ -36,58 +212,793 @@ def get_gspread_client():
             st.secrets["gcp_service_account"],
             scopes=["https://www.googleapis.com/auth/spreadsheets"],
         )
-        client = gspread.authorize(credentials)
+        # 모든 지점이 이 클라이언트 하나를 같이 씀 -> 연결 풀을 지점 수에 맞게
+        session = AuthorizedSession(credentials)
+        session.mount("https://", HTTPAdapter(pool_connections=CLIENT_POOL_SIZE, pool_maxsize=CLIENT_POOL_SIZE))
+        client = gspread.authorize(credentials, session=session)
         return client
     except Exception as e:
         st.error(f"❌ 인증 오류: {e}")
         return None
 
 # ==========================================
-# [핵심 함수] - 위치를 최상단으로 이동 (NameError 방지)
+# [저장소] 시트 읽기 / 일괄 쓰기 / 행 추가 / 범위 지우기
 # ==========================================
+def a1_to_bounds(a1):
+    # "B2:D" -> (2, 2, None, 4): 1부터 시작, 끝이 열려 있으면 None
+    g = gspread.utils.a1_range_to_grid_range(a1)
+    r1, c1 = g.get('startRowIndex', 0) + 1, g.get('startColumnIndex', 0) + 1
+    return r1, c1, g.get('endRowIndex'), g.get('endColumnIndex')
 
-# 1. 상태 업데이트 (출석, 차량 등)
-def update_check_status(student_name, col_name, status_value):
+def group_cell_updates(updates):
+    # 같은 열에서 연속된 행은 하나의 범위로 묶음 -> [(A1 범위, [[값], ...])]
+    by_col = collections.defaultdict(dict)
+    for r, c, v in updates: by_col[c][r] = v
+    for c, cells in by_col.items():
+        rows = sorted(cells)
+        start = 0
+        for i in range(1, len(rows) + 1):
+            if i < len(rows) and rows[i] == rows[i - 1] + 1: continue
+            run = rows[start:i]
+            rng = gspread.utils.rowcol_to_a1(run[0], c) + (":" + gspread.utils.rowcol_to_a1(run[-1], c) if len(run) > 1 else "")
+            yield rng, [[cells[r]] for r in run]
+            start = i
+
+class SheetStorage(abc.ABC):
+    name = ""
+    @abc.abstractmethod
+    def read_sheet(self, sheet_name): ...          # -> [[값, ...], ...] (get_all_values 형태)
+    @abc.abstractmethod
+    def read_range(self, sheet_name, a1): ...      # -> [[값, ...], ...]
+    @abc.abstractmethod
+    def batch_write(self, sheet_name, updates): ...  # updates: [(행, 열, 값)]
+    @abc.abstractmethod
+    def append_row(self, sheet_name, values): ...  # -> 추가된 시트 행 번호 (모르면 None)
+    @abc.abstractmethod
+    def clear_ranges(self, sheet_name, ranges): ...  # ranges: ["B2:B", ...]
+
+    def read_ranges(self, sheet_name, ranges): return [self.read_range(sheet_name, a1) for a1 in ranges]
+
+    def batch_read(self, requests):
+        # [(시트, A1 범위 또는 None=시트 전체)] -> 같은 순서의 [[값, ...], ...] 목록
+        return [self.read_sheet(name) if a1 is None else self.read_range(name, a1) for name, a1 in requests]
+
+    def batch_write_many(self, updates_by_sheet):
+        # {시트: [(행, 열, 값)]} 여러 시트에 걸친 쓰기
+        for sheet_name, updates in updates_by_sheet.items(): self.batch_write(sheet_name, updates)
+
+# [API 스케줄러] 모든 시트 API 호출을 분당 한도(읽기/쓰기 따로) 안에서 우선순위 순으로 실행
+SHEETS_READ_PER_MIN = get_setting("sheets_read_per_min", 60)  # 구글 시트 기본 한도: 사용자당 분당 읽기 60회
+SHEETS_WRITE_PER_MIN = get_setting("sheets_write_per_min", 60)
+API_BURST_SEC = 10  # 몇 초 분량까지 몰아서 쓸 수 있는지 (토큰 버킷 크기)
+API_MAX_RETRY = 5
+API_BACKOFF_BASE = 1.0  # 초: 재시도 대기 = 0.5~1배 지터 x 2^시도
+API_BACKOFF_MAX = 32.0
+API_TRANSIENT_CODES = {429, 500, 502, 503, 504}
+API_OFFLINE_RETRY = 1  # 네트워크 자체가 끊긴 경우는 오래 붙잡지 않음 (쓰기는 저널, 읽기는 디스크 스냅샷으로 버팀)
+OFFLINE_RETRY_SEC = 5  # 오프라인일 때 다시 연결을 시도하는 간격
+PRIORITY_USER, PRIORITY_NORMAL, PRIORITY_BACKGROUND = 0, 1, 2  # 작을수록 먼저
+
+api_priority = contextvars.ContextVar("api_priority", default=PRIORITY_NORMAL)
+
+def run_with_priority(priority, fn, *args):
+    # 이 호출 안에서 나가는 시트 API 요청의 우선순위 지정 (백그라운드 스레드 등)
+    token = api_priority.set(priority)
+    try: return fn(*args)
+    finally: api_priority.reset(token)
+
+def is_offline_error(e):
+    # 네트워크 오류 (requests 예외는 OSError 계열) + 토큰 갱신 요청이 나가지 못한 경우
+    return isinstance(e, (OSError, TransportError, RefreshError))
+
+def is_transient_error(e):
+    # 429/5xx 와 오프라인 오류만 재시도
+    if isinstance(e, gspread.exceptions.APIError): return e.code in API_TRANSIENT_CODES
+    return is_offline_error(e)
+
+def may_have_landed(e):
+    # 429 는 시트가 요청을 받지 않은 것. 5xx/연결 오류는 응답만 못 받았을 수 있음
+    return not (isinstance(e, gspread.exceptions.APIError) and e.code == 429)
+
+APPEND_CHECK_ROWS = 20  # 마지막 행 번호를 모를 때 시트 끝에서 찾아볼 행 수
+APPEND_STAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # 공지/상담일지 첫 칸: 등록 시각 (같은 내용을 다시 올린 행과 구분됨)
+
+def append_landed(storage, sheet_name, values, after=None):
+    # 행 추가는 다시 보내면 두 번 들어감 -> 응답 전에 끊겼던 행이 이미 들어갔는지 먼저 확인
+    # 행마다 등록 시각이 있어서 값이 같으면 그 행. after: 이 시트에서 마지막으로 들어간 행 번호 -> 그 뒤만 읽음
+    trim = lambda row: [str(v) for v in row][:max((i + 1 for i, v in enumerate(row) if str(v) != ''), default=0)]
+    if after: rows = storage.read_range(sheet_name, f"A{after + 1}:" + gspread.utils.rowcol_to_a1(1, max(len(values), 1))[:-1])
+    else: rows = storage.read_sheet(sheet_name)[-APPEND_CHECK_ROWS:]  # 재시작 직후 등 아직 모름
+    return trim(values) in [trim(row) for row in rows]
+
+class ApiScheduler:
+    def __init__(self, per_min):
+        self._cond = threading.Condition()
+        self._rate = {kind: n / 60 for kind, n in per_min.items()}
+        self._capacity = {kind: max(1.0, n / 60 * API_BURST_SEC) for kind, n in per_min.items()}
+        self._tokens = dict(self._capacity)
+        self._refilled = {kind: time.monotonic() for kind in per_min}
+        self._waiting = {kind: [] for kind in per_min}  # (우선순위, 순번) 힙
+        self._seq = itertools.count()
+        self.calls = collections.Counter()
+        self.throttled = collections.Counter()  # 한도 때문에 기다린 호출 수
+        self.retries = 0
+        self.last_error = ""
+
+    def _wait_time(self, kind):
+        now = time.monotonic()
+        self._tokens[kind] = min(self._capacity[kind], self._tokens[kind] + (now - self._refilled[kind]) * self._rate[kind])
+        self._refilled[kind] = now
+        return 0 if self._tokens[kind] >= 1 else (1 - self._tokens[kind]) / self._rate[kind]
+
+    def _acquire(self, kind, priority):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting[kind], ticket)
+            throttled = False
+            while True:
+                wait = self._wait_time(kind)
+                if wait == 0 and self._waiting[kind][0] == ticket:
+                    heapq.heappop(self._waiting[kind])
+                    self._tokens[kind] -= 1
+                    self._cond.notify_all()
+                    return
+                if wait and not throttled: throttled = True; self.throttled[kind] += 1
+                self._cond.wait(timeout=wait or 1.0)
+
+    def call(self, kind, fn, op=None, idempotent=True):
+        # kind: "read" | "write". 일시적 오류는 지터 백오프로 재시도, 나머지는 그대로 올려 보냄
+        # 두 번 보내면 두 번 반영되는 호출(행 추가)은 요청이 거절된 429만 재시도
+        priority = api_priority.get()
+        for attempt in range(API_MAX_RETRY + 1):
+            self._acquire(kind, priority)
+            self.calls[kind] += 1
+            try:
+                with get_metrics().timer(f"sheets.{op or kind}", kind="api"): return fn()
+            except Exception as e:
+                limit = API_OFFLINE_RETRY if is_offline_error(e) else API_MAX_RETRY
+                if attempt >= limit or not is_transient_error(e) or (not idempotent and may_have_landed(e)): raise
+                with self._cond: self.retries += 1; self.last_error = str(e)
+                time.sleep(min(API_BACKOFF_MAX, API_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    def stats(self):
+        with self._cond:
+            return {"queued": sum(len(w) for w in self._waiting.values()), "calls": dict(self.calls),
+                    "throttled": dict(self.throttled), "retries": self.retries, "last_error": self.last_error}
+
+@branch_resource
+def get_api_scheduler():
+    # 서비스 계정 하나의 분당 한도를 지점 수로 나눠서 지점마다 따로 -> 한 지점이 몰려도 다른 지점 몫은 그대로
+    share = lambda per_min: max(1, per_min // len(BRANCHES))
+    return ApiScheduler({"read": share(SHEETS_READ_PER_MIN), "write": share(SHEETS_WRITE_PER_MIN)})
+
+class GoogleSheetsStorage(SheetStorage):
+    name = "sheets"
+    def __init__(self, client, sheet_id, scheduler):
+        self.client = client
+        self.sheet_id = sheet_id
+        self.scheduler = scheduler
+        self._lock = threading.Lock()
+        self._book = None  # Spreadsheet 핸들 (open_by_key 는 메타데이터 조회라 한 번만)
+        self._sheets = {}  # 시트 이름 -> Worksheet 핸들
+
+    def _spreadsheet(self):
+        # 한도 대기/재시도로 오래 걸릴 수 있는 호출은 잠금 밖에서, 결과만 잠금 안에서 (먼저 받은 쪽을 씀)
+        with self._lock: book = self._book
+        if book is not None: return book
+        book = self.scheduler.call("read", lambda: self.client.open_by_key(self.sheet_id), "open_by_key")
+        with self._lock:
+            if self._book is None: self._book = book
+            return self._book
+
+    def _ws(self, sheet_name):
+        with self._lock: ws = self._sheets.get(sheet_name)
+        if ws is None:
+            book = self._spreadsheet()
+            ws = self.scheduler.call("read", lambda: book.worksheet(sheet_name), "worksheet")
+            with self._lock: self._sheets[sheet_name] = ws
+        return ws
+
+    def invalidate(self, sheet_name=None):
+        with self._lock:
+            if sheet_name is None: self._book = None; self._sheets.clear()
+            else: self._sheets.pop(sheet_name, None)
+
+    @staticmethod
+    def _sheet_missing(e):
+        # 404, 또는 시트 이름을 못 찾은 400 ("Unable to parse range: '시트'!A1") 만. 잘못된 값/범위 같은 400 은 다시 찾아도 같음
+        message = str(e.error.get('message', '')) if isinstance(getattr(e, 'error', None), dict) else str(e)
+        return e.code == 404 or (e.code == 400 and ("Unable to parse range" in message or "not found" in message.lower()))
+
+    def _on_sheet(self, sheet_name, kind, op, fn, idempotent=True):
+        # 캐시된 핸들로 바로 호출. 시트 이름이 바뀌었거나 삭제돼서 실패하면 핸들을 버리고 한 번만 다시 찾음
+        ws = self._ws(sheet_name)
+        try: return self.scheduler.call(kind, lambda: fn(ws), op, idempotent)
+        except gspread.exceptions.APIError as e:
+            if not self._sheet_missing(e): raise
+            self.invalidate(sheet_name)
+            ws = self._ws(sheet_name)
+            return self.scheduler.call(kind, lambda: fn(ws), op, idempotent)
+
+    def read_sheet(self, sheet_name): return self._on_sheet(sheet_name, "read", "get_all_values", lambda ws: ws.get_all_values())
+    def read_range(self, sheet_name, a1): return self._on_sheet(sheet_name, "read", "get", lambda ws: ws.get(a1))
+    def read_ranges(self, sheet_name, ranges): return self._on_sheet(sheet_name, "read", "batch_get", lambda ws: ws.batch_get(ranges))
+    def append_row(self, sheet_name, values):
+        result = self._on_sheet(sheet_name, "write", "append_row", lambda ws: ws.append_row(values), idempotent=False)
+        updated = (result or {}).get('updates', {}).get('updatedRange', '')
+        return a1_to_bounds(updated.partition('!')[2])[0] if updated else None
+    def clear_ranges(self, sheet_name, ranges): self._on_sheet(sheet_name, "write", "batch_clear", lambda ws: ws.batch_clear(ranges))
+
+    def batch_write(self, sheet_name, updates):
+        if not updates: return
+        data = [{'range': rng, 'values': vals} for rng, vals in group_cell_updates(updates)]
+        self._on_sheet(sheet_name, "write", "batch_update", lambda ws: ws.batch_update(data))
+
+    def batch_read(self, requests):
+        # 여러 시트/범위를 values_batch_get 한 번으로
+        ranges = [f"'{name}'" if a1 is None else gspread.utils.absolute_range_name(name, a1) for name, a1 in requests]
+        book = self._spreadsheet()
+        result = self.scheduler.call("read", lambda: book.values_batch_get(ranges), "values_batch_get")
+        grids = [vr.get('values', []) for vr in result.get('valueRanges', [])]
+        return [gspread.utils.fill_gaps(g) if a1 is None and g else g for g, (_, a1) in zip(grids, requests)]
+
+    def batch_write_many(self, updates_by_sheet):
+        # 여러 시트에 걸친 쓰기를 values_batch_update 한 번으로
+        data = [{'range': gspread.utils.absolute_range_name(name, rng), 'values': vals}
+                for name, updates in updates_by_sheet.items() for rng, vals in group_cell_updates(updates)]
+        if not data: return
+        book = self._spreadsheet()
+        self.scheduler.call("write", lambda: book.values_batch_update({'valueInputOption': 'RAW', 'data': data}), "values_batch_update")
+
+class SQLiteStorage(SheetStorage):
+    name = "sqlite"
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cells (sheet TEXT, row INTEGER, col INTEGER, value TEXT, PRIMARY KEY (sheet, row, col))")
+        self._conn.commit()
+
+    def _grid(self, cells, r1=1, c1=1, min_width=0):
+        if not cells: return []
+        height = max(r for r, _, _ in cells) - r1 + 1
+        width = max(min_width, max(c for _, c, _ in cells) - c1 + 1)
+        grid = [[''] * width for _ in range(height)]
+        for r, c, v in cells: grid[r - r1][c - c1] = v
+        return grid
+
+    def read_sheet(self, sheet_name):
+        with self._lock:
+            cells = self._conn.execute("SELECT row, col, value FROM cells WHERE sheet = ?", (sheet_name,)).fetchall()
+        return self._grid(cells)
+
+    def read_range(self, sheet_name, a1):
+        r1, c1, r2, c2 = a1_to_bounds(a1)
+        with self._lock:
+            cells = self._conn.execute(
+                "SELECT row, col, value FROM cells WHERE sheet = ? AND row >= ? AND row <= ? AND col >= ? AND col <= ?",
+                (sheet_name, r1, r2 or 1 << 30, c1, c2 or 1 << 30)).fetchall()
+        return self._grid(cells, r1, c1)
+
+    def batch_write(self, sheet_name, updates):
+        with self._lock:
+            # 빈 값은 행을 지워서 시트처럼 '빈 칸'으로 취급
+            self._conn.executemany("DELETE FROM cells WHERE sheet = ? AND row = ? AND col = ?",
+                                   [(sheet_name, int(r), int(c)) for r, c, v in updates if v == ''])
+            self._conn.executemany("INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?)",
+                                   [(sheet_name, int(r), int(c), str(v)) for r, c, v in updates if v != ''])
+            self._conn.commit()
+
+    def append_row(self, sheet_name, values):
+        with self._lock:
+            last = self._conn.execute("SELECT COALESCE(MAX(row), 0) FROM cells WHERE sheet = ?", (sheet_name,)).fetchone()[0]
+        self.batch_write(sheet_name, [(last + 1, i + 1, v) for i, v in enumerate(values)])
+        return last + 1
+
+    def clear_ranges(self, sheet_name, ranges):
+        with self._lock:
+            for a1 in ranges:
+                r1, c1, r2, c2 = a1_to_bounds(a1)
+                self._conn.execute("DELETE FROM cells WHERE sheet = ? AND row >= ? AND row <= ? AND col >= ? AND col <= ?",
+                                   (sheet_name, r1, r2 or 1 << 30, c1, c2 or 1 << 30))
+            self._conn.commit()
+
+    def replace_sheet(self, sheet_name, rows):
+        with self._lock:
+            self._conn.execute("DELETE FROM cells WHERE sheet = ?", (sheet_name,))
+            self._conn.executemany("INSERT INTO cells VALUES (?, ?, ?, ?)",
+                                   [(sheet_name, r + 1, c + 1, v) for r, row in enumerate(rows) for c, v in enumerate(row) if v != ''])
+            self._conn.commit()
+
+class ReplicaStorage(SheetStorage):
+    """읽기는 로컬 SQLite 에서 바로, 쓰기는 로컬 반영 후 구글 시트로 백그라운드 전송"""
+    name = "replica"
+    def __init__(self, primary, local):
+        self.primary = primary
+        self.local = local
+        self._synced = {}  # 시트 이름 -> 마지막 동기화 시각
+        self._refreshing = set()
+        self._outbox = collections.deque()
+        self._sent = 0  # 로컬에 먼저 반영한 변경 수 (새로고침 도중에 들어온 변경이 있는지 확인용)
+        self._tails = {}  # 시트 이름 -> 시트에 마지막으로 추가한 행 번호 (응답 못 받은 행 추가 확인용)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.last_error = ""
+        self.parked = collections.deque(maxlen=20)  # 시트가 거부해서(400 등) 보내기를 포기한 변경
+        threading.Thread(target=self._push_loop, daemon=True).start()
+
+    def refresh(self, sheet_name):
+        # 먼저 받아 오고, 보낼 변경이 남아 있거나 받는 동안 로컬 변경이 들어왔으면 덮어쓰지 않고 다음 기회에
+        try:
+            with self._lock: sent = self._sent
+            rows = self.primary.read_sheet(sheet_name)
+            with self._lock:
+                if not self._outbox and self._sent == sent: self.local.replace_sheet(sheet_name, rows)
+            self._synced[sheet_name] = time.time()
+        finally:
+            with self._lock: self._refreshing.discard(sheet_name)
+
+    def _ensure_fresh(self, sheet_name):
+        if sheet_name not in self._synced:
+            self.refresh(sheet_name)
+            return
+        if time.time() - self._synced[sheet_name] < REPLICA_REFRESH_SEC: return
+        with self._lock:
+            if sheet_name in self._refreshing: return
+            self._refreshing.add(sheet_name)
+        threading.Thread(target=run_with_priority, args=(PRIORITY_BACKGROUND, self.refresh, sheet_name), daemon=True).start()
+
+    def read_sheet(self, sheet_name):
+        self._ensure_fresh(sheet_name)
+        return self.local.read_sheet(sheet_name)
+
+    def read_range(self, sheet_name, a1):
+        self._ensure_fresh(sheet_name)
+        return self.local.read_range(sheet_name, a1)
+
+    def read_ranges(self, sheet_name, ranges):
+        self._ensure_fresh(sheet_name)
+        return self.local.read_ranges(sheet_name, ranges)
+
+    def batch_read(self, requests):
+        for name in {name for name, _ in requests}: self._ensure_fresh(name)
+        return self.local.batch_read(requests)
+
+    def _send(self, method, *args):
+        with self._lock:
+            getattr(self.local, method)(*args)
+            self._outbox.append((method, args))
+            self._sent += 1
+        self._wake.set()
+
+    def batch_write(self, sheet_name, updates): self._send("batch_write", sheet_name, updates)
+    def batch_write_many(self, updates_by_sheet): self._send("batch_write_many", updates_by_sheet)
+    def append_row(self, sheet_name, values): self._send("append_row", sheet_name, values)
+    def clear_ranges(self, sheet_name, ranges): self._send("clear_ranges", sheet_name, ranges)
+
+    def _push_loop(self):
+        api_priority.set(PRIORITY_USER)  # 탭 등 사용자가 한 변경 -> 백그라운드 읽기보다 먼저
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            unsure = False  # 맨 앞 행 추가가 응답 전에 끊김 -> 다시 보내기 전에 시트 끝 확인
+            while self._outbox:
+                method, args = self._outbox[0]
+                try:
+                    if not (unsure and append_landed(self.primary, *args, self._tails.get(args[0]))):
+                        row = getattr(self.primary, method)(*args)
+                        if method == "append_row" and row: self._tails[args[0]] = row
+                    self._outbox.popleft()
+                    self.last_error = ""
+                    unsure = False
+                except Exception as e:
+                    self.last_error = str(e)
+                    if is_transient_error(e):
+                        unsure = unsure or (method == "append_row" and may_have_landed(e))
+                        time.sleep(2)
+                        continue
+                    # 다시 보내도 안 되는 변경은 빼 두고 다음 변경으로 (하나 때문에 뒤가 전부 막히지 않게)
+                    # 로컬에만 반영된 값은 다음 새로고침에서 시트 내용으로 덮임
+                    self._outbox.popleft()
+                    unsure = False
+                    self.parked.append({"time": time.time(), "method": method, "sheet": args[0] if isinstance(args[0], str) else ", ".join(args[0]), "error": str(e)})
+                    self._synced.clear()
+
+@branch_resource
+def get_storage():
+    if STORAGE_BACKEND == "sqlite": return SQLiteStorage(branch_path(SQLITE_PATH))
     client = get_gspread_client()
-    if not client: return
-    try:
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet("원생명단")
-        cell = worksheet.find(student_name)
-        row_num = cell.row
-        
-        cols_to_update = []
-        if col_name == "출석확인":
-            if status_value == "결석" or status_value == "":
-                cols_to_update = ["출석확인", "등원확인", "하원확인"]
+    if not client: return None
+    sheets = GoogleSheetsStorage(client, BRANCHES[current_branch.get()], get_api_scheduler())
+    if STORAGE_BACKEND == "replica": return ReplicaStorage(sheets, SQLiteStorage(branch_path(SQLITE_PATH)))
+    return sheets
+
+# ==========================================
+# [쓰기 큐] 여러 세션의 셀 변경을 모아서 한 번에 반영
+# ==========================================
+WRITE_FLUSH_INTERVAL = 0.3  # 초: 이 시간 동안 들어온 변경은 batch_update 한 번으로 묶음
+WRITE_MAX_RETRY = 3
+JOURNAL_KEEP_SEC = 86400  # 반영이 끝난 저널 기록은 하루 뒤 정리
+
+class WriteJournal:
+    """시트로 보내기 전에 모든 변경을 먼저 남기는 추가 전용 로컬 기록 (재시작해도 남음)"""
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY AUTOINCREMENT, at REAL, sheet TEXT, row INTEGER, col INTEGER, payload TEXT, done INTEGER DEFAULT 0)")
+        self._conn.commit()
+
+    def append(self, sheet_name, entries):
+        # entries: [(행, 열, payload)] (행 추가는 행/열 None) -> 저널 순번 목록
+        # 칸 변경의 payload 에 원생 키 + 컬럼명이 있어서 재생할 때 행/열은 그 시점 명단 기준으로 다시 찾음
+        with self._lock:
+            seqs = [self._conn.execute("INSERT INTO journal (at, sheet, row, col, payload) VALUES (?, ?, ?, ?, ?)",
+                                       (time.time(), sheet_name, r, c, json.dumps(payload, ensure_ascii=False))).lastrowid for r, c, payload in entries]
+            self._conn.commit()
+        return seqs
+
+    def pending(self):
+        with self._lock: rows = self._conn.execute("SELECT seq, sheet, row, col, payload FROM journal WHERE done = 0 ORDER BY seq").fetchall()
+        return [(seq, sheet_name, r, c, json.loads(payload)) for seq, sheet_name, r, c, payload in rows]
+
+    def done(self, seqs):
+        # 반영했거나(충돌/포기 포함) 더 새 변경에 덮인 기록
+        if not seqs: return
+        with self._lock:
+            self._conn.executemany("UPDATE journal SET done = 1 WHERE seq = ?", [(seq,) for seq in seqs])
+            self._conn.execute("DELETE FROM journal WHERE done = 1 AND at < ?", (time.time() - JOURNAL_KEEP_SEC,))
+            self._conn.commit()
+
+@branch_resource
+def get_write_journal():
+    return WriteJournal(branch_path(JOURNAL_PATH))
+
+class WriteQueue:
+    def __init__(self, storage, sheet_name, on_flush=None, journal=None, stamp=None, on_append=None, known=None, index=None):
+        self.storage = storage
+        self.sheet_name = sheet_name
+        self.on_flush = on_flush  # 반영 성공한 (행, 열, 값) 목록을 받는 콜백
+        self.stamp = stamp  # 쓰기에 수정 표시를 붙이는 콜백 (RosterSync.stamp)
+        self.on_append = on_append  # 시트에 들어간 행 추가 (시트, 값들, 시트 행 번호 또는 None)를 받는 콜백
+        self.known = known  # [(행, 열)] -> {(행, 열): 마지막으로 동기화한 시트 값} (RosterSync.cells)
+        self.index = index  # 원생 키/컬럼명 -> 지금 시트 위치 (AddressIndex). 보내기 직전에 행/열을 다시 찾음
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # 마감 등에서 직접 flush 할 때 백그라운드 flush 와 겹치지 않게
+        self._wake = threading.Event()
+        self._pending = {}   # (row, col) -> [값, 컬럼명, 재시도횟수, 화면에서 본 값(None=확인 안 함), 원생 키, 저널 순번들, 세션]
+        self._inflight = {}  # 반영 중인 변경 (화면 오버레이용)
+        self._appends = collections.deque()  # 연결이 끊겨 못 보낸 행 추가 (저널 순번, 시트, 값들, 이미 들어갔을 수 있음, 세션) - 공지/상담일지
+        self._tails = {}  # 시트 이름 -> 마지막으로 추가한 행 번호 (응답 못 받은 행 추가는 그 뒤만 확인)
+        self.offline_since = None  # 연결 오류로 반영이 밀리기 시작한 시각
+        self.enqueued = 0
+        self.flushes = 0
+        self.cells_written = 0
+        self.last_latency_ms = 0.0
+        self.last_batch_size = 0
+        self.last_error = ""
+        self.failures = collections.deque(maxlen=50)  # 재시도 끝에 포기(롤백)한 변경 (세션별로 보여 줌)
+        self.conflicts = collections.deque(maxlen=50)  # 다른 기기가 먼저 바꿔서 적용하지 않은 변경 (세션별로 보여 줌)
+        self._replay()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _replay(self):
+        # 지난 실행에서 반영 못 한 저널을 순서대로 다시 대기열에 (같은 칸은 마지막 값 하나로 합쳐짐)
+        if not self.journal: return
+        rejected = []
+        with self._lock:
+            for seq, sheet_name, r, c, payload in self.journal.pending():
+                if r is None: self._appends.append((seq, sheet_name, payload, True, None))  # 보냈는지 알 수 없음 -> 확인 후 보냄
+                elif sheet_name != self.sheet_name or not self._put(r, c, *payload, [seq]): rejected.append(seq)
+        self.journal.done(rejected)
+        if self._pending or self._appends: self._wake.set()
+
+    def put(self, row, col, value, col_name, expected=None, label=""):
+        return self.put_many([(row, col, value, col_name, expected, label)])[0]
+
+    def put_many(self, cells):
+        # cells: [(행, 열, 값, 컬럼명, 화면에서 본 값, 원생 키)]. 저널에 먼저 남기고 바로 응답
+        # 한 번에 적재하므로 같은 flush(batch_update 한 번)에 들어감
+        seqs = self.journal.append(self.sheet_name, [(r, c, [v, name, expected, label]) for r, c, v, name, expected, label in cells]) if self.journal else [None] * len(cells)
+        session = current_session_id()
+        with self._lock: accepted = [self._put(*cell, [seq] if seq else [], session) for cell, seq in zip(cells, seqs)]
+        if self.journal: self.journal.done([seq for seq, ok in zip(seqs, accepted) if not ok])
+        if any(accepted): self._wake.set()
+        return accepted
+
+    def _put(self, row, col, value, col_name, expected, label, seqs, session=None):
+        # expected: 화면에서 보고 바꾼 값. 반영 직전 시트 값이 이것(또는 같은 새 값)이 아니면 쓰지 않음
+        pending = self._pending.get((row, col))
+        if pending and expected is not None:
+            if pending[0] not in (expected, value):  # 이 서버의 다른 기기가 방금 바꿈
+                self._conflict(label, col_name, value, pending[0], session)
+                return False
+            expected = pending[3]  # 시트와 비교할 값은 처음 대기열에 들어올 때 본 값
+        # 덮인 변경의 저널 순번도 같이 들고 감 -> 반영되면 한꺼번에 완료 처리
+        self._pending[(row, col)] = [value, col_name, 0, expected, label, (pending[5] if pending else []) + seqs, session]
+        self.enqueued += 1
+        return True
+
+    def append_row(self, sheet_name, values):
+        # 행 추가(공지/상담일지): 저널에 남긴 뒤 바로 보내 봄. 연결 오류면 대기열에 두고 False (나중에 순서대로)
+        seq = self.journal.append(sheet_name, [(None, None, values)])[0] if self.journal else None
+        with self._lock: queued = bool(self._appends)  # 앞서 밀린 행이 있으면 순서를 지키려고 뒤에 붙임
+        unsure = False
+        if not queued:
+            try:
+                row = self.storage.append_row(sheet_name, values)
+                if seq: self.journal.done([seq])
+                self._appended(sheet_name, values, row)
+                return True
+            except Exception as e:
+                if not is_transient_error(e) or not seq:
+                    if seq: self.journal.done([seq])
+                    raise
+                self._went_offline(e)
+                unsure = may_have_landed(e)
+        with self._lock: self._appends.append((seq, sheet_name, values, unsure, current_session_id()))
+        self._wake.set()
+        return False
+
+    def _went_offline(self, e):
+        self.last_error = str(e)
+        if self.offline_since is None: self.offline_since = time.time()
+
+    def _flush_appends(self):
+        while True:
+            with self._lock:
+                if not self._appends: return
+                seq, sheet_name, values, unsure, session = self._appends[0]
+            try:
+                row = None if unsure and append_landed(self.storage, sheet_name, values, self._tails.get(sheet_name)) else self.storage.append_row(sheet_name, values)
+                self._appended(sheet_name, values, row)
+            except Exception as e:
+                if is_transient_error(e):
+                    if may_have_landed(e):
+                        with self._lock: self._appends[0] = (seq, sheet_name, values, True, session)
+                    raise
+                self.failures.append({"time": time.time(), "cells": len(values), "error": str(e), "session": session})
+            with self._lock: self._appends.popleft()
+            self.journal.done([seq])
+
+    def _appended(self, sheet_name, values, row):
+        if row: self._tails[sheet_name] = max(row, self._tails.get(sheet_name, 0))
+        if self.on_append: self.on_append(sheet_name, values, row)
+
+    def _relocate(self, pending):
+        # 대기 중인 변경을 지금 명단의 위치로 (재시작 뒤 저널 재생분, 오래 밀린 변경: 그 사이 정렬/행 추가로 행이 바뀌었을 수 있음)
+        # 원생이 명단에서 사라졌으면 충돌로 버림 -> (옮긴 대기열, 버린 저널 순번)
+        moved, gone = {}, []
+        for (r, c), entry in pending.items():
+            row, col = (self.index.row(entry[4]), self.index.col(entry[1])) if entry[4] else (r, c)
+            if row and col: moved[(row, col)] = entry
             else:
-                cols_to_update = ["출석확인"]
+                self._conflict(entry[4], entry[1], entry[0], None, entry[6])
+                gone += entry[5]
+        return moved, gone
+
+    def _conflict(self, label, col_name, value, current, session):
+        self.conflicts.append({"time": time.time(), "label": label, "col": col_name, "value": value, "current": current, "session": session})
+
+    def notices(self, session, within=60):
+        # 이 세션이 만든 변경의 실패/충돌만 (세션 없는 것 = 재시작 뒤 저널 재생분은 모두에게)
+        mine = lambda f: f["session"] in (session, None) and time.time() - f["time"] < within
+        return [f for f in self.failures if mine(f)], [c for c in self.conflicts if mine(c)]
+
+    def overlay(self, df):
+        # 아직 시트에 반영되지 않은 변경을 화면용 DataFrame에 덮어씀 (df 인덱스 + 2 = 시트 행)
+        with self._lock:
+            items = list(self._inflight.items()) + list(self._pending.items())
+        for (row, _), (value, col_name, *_) in items:
+            if col_name in df.columns and (row - 2) in df.index:
+                df.at[row - 2, col_name] = value
+        return df
+
+    def _run(self):
+        api_priority.set(PRIORITY_USER)  # 탑승/출석 체크 반영은 다른 호출보다 먼저
+        while True:
+            self._wake.wait()
+            time.sleep(OFFLINE_RETRY_SEC if self.offline_since else WRITE_FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock: self._flush()
+
+    def _flush(self):
+        try: self._flush_appends()
+        except Exception as e:
+            self._went_offline(e)
+            self._wake.set()
+            return
+        gone = []
+        with self._lock:
+            if not self._pending: return
+            if self.index and not self.index.ready():
+                self._wake.set()  # 재시작 직후: 원생명단을 읽어 원생 위치를 알 때까지 보내지 않음
+                return
+            batch, self._pending = self._pending, {}
+            if self.index: batch, gone = self._relocate(batch)
+            self._inflight = batch
+        if self.journal: self.journal.done(gone)
+        start = time.perf_counter()
+        finished = [seq for v in batch.values() for seq in v[5]]  # 반영(또는 충돌로 버림)되면 저널에서 완료 처리
+        try:
+            checked = [key for key, v in batch.items() if v[3] is not None]
+            # 마지막 동기화 값이 화면에서 본 값(또는 새 값)과 같으면 시트를 다시 읽지 않음 -> 보통의 탭은 쓰기 한 번
+            # (그 사이 몇 초 안에 다른 서버가 같은 칸을 바꾼 것까지는 못 잡음. 읽고 쓰는 것도 원래 원자적이지 않음)
+            known = self.known(checked) if self.known and checked else {}
+            checked = [key for key in checked if known.get(key) not in (batch[key][3], batch[key][0])]
+            if checked:
+                # 비교-후-쓰기: 스냅샷과 다른 칸만 batch_get 한 번으로 읽어서 화면에서 본 값과 다르면 쓰지 않음
+                seen = []
+                current = self.storage.read_ranges(self.sheet_name, [gspread.utils.rowcol_to_a1(r, c) for r, c in checked])
+                for (r, c), grid in zip(checked, current):
+                    now = grid[0][0] if grid and grid[0] else ''
+                    value, col_name, _, expected, label, _, session = batch[(r, c)]
+                    if now in (expected, value): continue
+                    self._conflict(label, col_name, value, now, session)
+                    seen.append((r, c, now))
+                    with self._lock: del batch[(r, c)]
+                # 충돌한 칸은 시트의 실제 값으로 스냅샷을 맞춰서 화면이 바로 따라가게
+                if seen and self.on_flush: self.on_flush(seen)
+            data = [(r, c, v[0]) for (r, c), v in batch.items()]
+            if data: self.storage.batch_write_many(self.stamp({self.sheet_name: data}) if self.stamp else {self.sheet_name: data})
+            self.last_latency_ms = (time.perf_counter() - start) * 1000
+            self.last_batch_size = len(data)
+            self.flushes += 1
+            self.cells_written += len(data)
+            self.last_error = ""
+            self.offline_since = None
+            if self.journal: self.journal.done(finished)
+            # 캐시를 지우지 않고 반영된 값만 스냅샷에 패치
+            if self.on_flush: self.on_flush(data)
+        except Exception as e:
+            self.last_error = str(e)
+            offline = is_transient_error(e)
+            if offline: self._went_offline(e)
+            dropped = []
+            with self._lock:
+                # 실패분은 더 새로운 값이 들어오지 않은 경우에만 다시 대기열로 (연결 오류는 횟수 제한 없이 저널과 함께 기다림)
+                for key, (value, col_name, tries, expected, label, seqs, session) in batch.items():
+                    if key in self._pending: self._pending[key][5] = seqs + self._pending[key][5]
+                    elif offline or tries + 1 < WRITE_MAX_RETRY: self._pending[key] = [value, col_name, tries + (not offline), expected, label, seqs, session]
+                    else: dropped.append((seqs, session))
+            # 포기한 변경은 오버레이에서 빠지므로 화면이 원래 값으로 되돌아감
+            if dropped:
+                for session, n in collections.Counter(session for _, session in dropped).items():
+                    self.failures.append({"time": time.time(), "cells": n, "error": str(e), "session": session})
+                if self.journal: self.journal.done([seq for seqs, _ in dropped for seq in seqs])
+            if self._pending: self._wake.set()
+        finally:
+            with self._lock: self._inflight = {}
+
+    def stats(self):
+        with self._lock: pending = len(self._pending) + len(self._inflight) + len(self._appends)
+        return {
+            "pending": pending,
+            "offline_since": self.offline_since,
+            "flushes": self.flushes,
+            "coalesced": max(self.enqueued - self.flushes, 0),
+            "last_latency_ms": round(self.last_latency_ms, 1),
+            "last_batch_size": self.last_batch_size,
+            "last_error": self.last_error,
+            "conflicts": len(self.conflicts),
+        }
+
+@branch_resource
+def get_write_queue():
+    roster = get_roster_sync()
+    return WriteQueue(get_storage(), "원생명단", on_flush=roster.apply, journal=get_write_journal(), stamp=roster.stamp,
+                      on_append=get_consultation_index().on_append, known=roster.cells, index=get_address_index())
+
+# ==========================================
+# [주소 인덱스] 원생 키 -> 시트 행 / 헤더 -> 열 (worksheet.find 대체)
+# ==========================================
+STUDENT_ID_COLS = ["원생번호", "번호", "ID"]
+
+def make_student_keys(df):
+    # 동명이인(김지안 2명)도 구분되는 고정 키: ID 컬럼 > 이름 > 이름|생일 > 이름|생일#순번
+    keys = df['이름'].astype(str).str.strip()
+    id_col = next((c for c in STUDENT_ID_COLS if c in df.columns), None)
+    if id_col:
+        ids = df[id_col].astype(str).str.strip()
+        keys = keys.where(ids == '', '#' + ids)
+    dup = keys.duplicated(keep=False)
+    if dup.any():
+        birth_cols = [c for c in df.columns if '생일' in c or '생년' in c]
+        extra_col = birth_cols[0] if birth_cols else ('수련부' if '수련부' in df.columns else None)
+        if extra_col: keys = keys.where(~dup, keys + '|' + df[extra_col].astype(str).str.strip())
+        dup = keys.duplicated(keep=False)
+        if dup.any(): keys = keys.where(~dup, keys + '#' + (keys.groupby(keys).cumcount() + 1).astype(str))
+    return keys
+
+class AddressIndex:
+    def __init__(self):
+        self.signature = None
+        self.rows = {}  # 원생 키 -> 시트 행 번호
+        self.cols = {}  # 헤더 -> 시트 열 번호
+        self.builds = 0
+
+    def sync(self, headers, keys):
+        # 행 추가/순서 변경이 없으면 그대로 유지
+        signature = hash((tuple(headers), tuple(keys)))
+        if signature == self.signature: return
+        self.cols = {name: i + 1 for i, name in enumerate(headers) if name.strip()}
+        self.rows = {key: i + 2 for i, key in enumerate(keys)}
+        self.signature = signature
+        self.builds += 1
+
+    def row(self, key): return self.rows.get(key)
+    def col(self, name): return self.cols.get(name)
+    def ready(self): return self.signature is not None  # 원생명단을 한 번이라도 읽었는지
+
+@branch_resource
+def get_address_index():
+    return AddressIndex()
+
+# ==========================================
+# [핵심 함수] - 위치를 최상단으로 이동 (NameError 방지)
+# ==========================================
+
+# 1. 상태 업데이트 (출석, 차량 등)
+def seen_value(seen, col):
+    # 화면에 그렸던 값 (없으면 None -> 충돌 확인 없이 씀)
+    if seen is None or col not in seen: return None
+    v = seen[col]
+    return '' if pd.isna(v) else str(v)
+
+def status_cells(student_key, col_name, status_value, seen=None):
+    # 쓰기 큐에 넣을 칸 목록. 출석확인을 결석/빈칸으로 바꾸면 등·하원 체크도 같이
+    index = get_address_index()
+    row_num = index.row(student_key)
+    if not row_num: raise LookupError(f"'{student_key}' 원생을 찾을 수 없습니다.")
+    
+    cols_to_update = []
+    if col_name == "출석확인":
+        if status_value == "결석" or status_value == "":
+            cols_to_update = ["출석확인", "등원확인", "하원확인"]
         else:
-            cols_to_update = [col_name]
+            cols_to_update = ["출석확인"]
+    else:
+        cols_to_update = [col_name]
+    return [(row_num, index.col(c), status_value, c, seen_value(seen, c), student_key) for c in cols_to_update if index.col(c)]
 
-        # API 최적화: 헤더 한 번만 읽기
-        headers = worksheet.row_values(1)
-        
-        for target_col in cols_to_update:
-            if target_col in headers:
-                col_idx = headers.index(target_col) + 1
-                worksheet.update_cell(row_num, col_idx, status_value)
-                time.sleep(0.5) # API 보호용 딜레이
-                
-        # 캐시 초기화 (화면 갱신용)
-        load_fast_data.clear() 
+def update_check_status(student_key, col_name, status_value, seen=None):
+    # seen: 화면에 그렸던 원생 행 (열 이름 -> 값). 주면 그 값 기준으로 비교-후-쓰기
+    if not get_storage(): return
+    try:
+        # 바로 쓰지 않고 쓰기 큐에 적재 -> 백그라운드에서 batch_update 한 번으로 반영
+        get_write_queue().put_many(status_cells(student_key, col_name, status_value, seen))
     except Exception as e:
         st.error(f"업데이트 실패: {e}")
 
+# 1-1. 일괄 처리 (정류장 전원 탑승, 반 전체 출석, 나머지 결석)
+def bulk_update_status(changes, label):
+    # changes: [(원생 키, 컬럼, 새 값, 화면에서 본 행)] -> 한 번에 적재해서 batch_update 한 번 + 되돌리기 기록
+    if not get_storage() or not changes: return
+    try: cells = [cell for key, col, value, seen in changes for cell in status_cells(key, col, value, seen)]
+    except Exception as e:
+        st.error(f"일괄 처리 실패: {e}")
+        return
+    accepted = get_write_queue().put_many(cells)
+    # 되돌리기 = 본 값으로 다시 쓰기 (지금 값이 방금 쓴 값일 때만). 다른 기기에 밀린 칸은 제외
+    undo = [(r, c, expected, col_name, value, key) for (r, c, value, col_name, expected, key), ok in zip(cells, accepted) if ok and expected is not None]
+    st.session_state.bulk_undo = {"label": label, "cells": undo, "students": len({cell[5] for cell in undo}), "branch": current_branch.get()}
+
+def undo_bulk_update():
+    undo = st.session_state.pop('bulk_undo', None)
+    if undo and undo["branch"] == current_branch.get() and get_storage(): get_write_queue().put_many(undo["cells"])
+
 # 2. 공지사항 추가
 def add_notice_to_sheet(content):
-    client = get_gspread_client()
+    if not get_storage(): return False
     try:
-        sh = client.open_by_key(SHEET_ID)
-        ws = sh.worksheet("공지사항")
-        today = get_korea_time().strftime("%Y-%m-%d")
-        # 날짜, 내용 순서로 추가
-        ws.append_row([today, content])
+        now = get_korea_time().strftime(APPEND_STAMP_FORMAT)
+        # 등록 시각, 내용 순서로 추가 (연결이 끊겼으면 저널에 남겨 두고 나중에)
+        if not get_write_queue().append_row("공지사항", [now, content]): st.warning("📴 연결이 끊겨 기기에 저장했습니다. 연결되면 자동으로 등록됩니다.")
         return True
     except Exception as e:
         st.error(f"공지 등록 오류: {e}")
@@ -95,587 +1006,1410 @@ def add_notice_to_sheet(content):
 
 # 3. 상담일지 추가
 def add_consultation_log(student_name, content):
-    client = get_gspread_client()
+    if not get_storage(): return False
     try:
-        sh = client.open_by_key(SHEET_ID)
-        ws = sh.worksheet("상담일지")
-        today = get_korea_time().strftime("%Y-%m-%d")
-        ws.append_row([today, student_name, content])
+        row = [get_korea_time().strftime(APPEND_STAMP_FORMAT), student_name, content]
+        if not get_write_queue().append_row("상담일지", row): st.warning("📴 연결이 끊겨 기기에 저장했습니다. 연결되면 자동으로 등록됩니다.")
         return True
-    except: return False
+    except Exception as e:
+        st.error(f"상담일지 저장 오류: {e}")
+        return False
 
 # 4. 장기일정 등록
-def register_long_term_schedule(student_name, start_date, end_date, reason):
-    client = get_gspread_client()
-    if not client: return False
+def register_long_term_schedule(student_key, start_date, end_date, reason, seen=None):
+    if not get_storage(): return False
     try:
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet("원생명단")
-        cell = worksheet.find(student_name)
-        row_num = cell.row
+        index = get_address_index()
+        row_num = index.row(student_key)
+        if not row_num: return False
         
         s_str = start_date.strftime("%Y-%m-%d")
         e_str = end_date.strftime("%Y-%m-%d")
         schedule_str = f"{s_str}~{e_str}:{reason}"
         
-        headers = worksheet.row_values(1)
-        if "장기일정" in headers:
-            col_idx = headers.index("장기일정") + 1
-            worksheet.update_cell(row_num, col_idx, schedule_str)
-        
+        changes = {"장기일정": schedule_str}
         # 오늘 날짜 포함 시 즉시 반영
         today_str = get_korea_time().strftime("%Y-%m-%d")
         if s_str <= today_str <= e_str:
-            col_map = {name: i+1 for i, name in enumerate(headers)}
-            if "출석확인" in col_map: worksheet.update_cell(row_num, col_map["출석확인"], "결석")
-            if "비고" in col_map: worksheet.update_cell(row_num, col_map["비고"], reason)
-            if "등원확인" in col_map: worksheet.update_cell(row_num, col_map["등원확인"], "결석")
-            if "하원확인" in col_map: worksheet.update_cell(row_num, col_map["하원확인"], "결석")
-            
-        load_fast_data.clear()
+            changes.update({"출석확인": "결석", "비고": reason, "등원확인": "결석", "하원확인": "결석"})
+        
+        queue = get_write_queue()
+        for col_name, value in changes.items():
+            col_idx = index.col(col_name)
+            if col_idx: queue.put(row_num, col_idx, value, col_name, seen_value(seen, col_name), student_key)
         return True
-    except: return False
+    except Exception as e:
+        st.error(f"장기일정 저장 오류: {e}")
+        return False
+
+# 5. 마감 저장 (월간출석부 기록 + 체크 열 초기화를 한 번에)
+DAY_CLOSE_COLS = ["등원확인", "하원확인", "출석확인", "비고"]
+
+def compute_day_marks(df):
+    # 출석 O > 비고(사유) > 결석 X > 빈칸
+    blank = pd.Series('', index=df.index)
+    status = df['출석확인'] if '출석확인' in df.columns else blank
+    note = df['비고'].astype(str).str.strip() if '비고' in df.columns else blank
+    return blank.mask(status == '결석', 'X').mask((note != '') & (note != 'nan'), note).mask(status == '출석', 'O')
+
+def plan_day_close(rows, monthly_header, today_str):
+    # -> {시트: [(행, 열, 값)]}. 오늘 열이 이미 있고 지울 것도 없으면 빈 계획 (두 번 눌러도 열이 두 개 생기지 않음)
+    headers = rows[0]
+    df = pd.DataFrame(rows[1:], columns=headers)
+    marks = compute_day_marks(df)
+    
+    check_cols = [c for c in DAY_CLOSE_COLS if c in headers]
+    has_checks = bool(check_cols) and (df[check_cols].astype(str).apply(lambda col: col.str.strip()) != '').any().any()
+    reclose = today_str in monthly_header
+    if reclose:
+        if not has_checks: return {}
+        day_col = monthly_header.index(today_str) + 1  # 마감 후 다시 체크한 내용은 같은 열에 덮어씀
+    else: day_col = max(len(monthly_header), 1) + 1
+    
+    rows_idx = range(2, len(rows) + 1)
+    monthly = [(1, 1, '이름'), (1, day_col, today_str)]
+    monthly += [(r, 1, n) for r, n in zip(rows_idx, df['이름'].tolist())]
+    # 다시 마감할 때는 새로 체크한 칸만 (앞서 마감하며 지운 체크 때문에 기존 O/X를 빈칸으로 덮지 않음)
+    monthly += [(r, day_col, m) for r, m in zip(rows_idx, marks.tolist()) if m or not reclose]
+    clears = [(r, headers.index(c) + 1, '') for c in check_cols for r in rows_idx]
+    return {"월간출석부": monthly, "원생명단": clears}
+
+@branch_resource
+def get_day_close_lock():
+    return threading.Lock()
 
-# 5. 마감 저장
 def archive_daily_attendance():
-    client = get_gspread_client()
-    if not client: return False, "서버 연결 실패"
+    storage = get_storage()
+    if not storage: return False, "서버 연결 실패"
+    lock = get_day_close_lock()
+    if not lock.acquire(blocking=False): return False, "다른 기기에서 마감 중입니다."
     try:
-        sh = client.open_by_key(SHEET_ID)
-        ws_daily = sh.worksheet("원생명단")
-        try: ws_monthly = sh.worksheet("월간출석부")
-        except: return False, "'월간출석부' 시트가 없습니다."
-
-        daily_data = ws_daily.get_all_values()
-        if len(daily_data) < 2: return False, "데이터가 없습니다."
-        
-        headers = daily_data[0]
-        df_daily = pd.DataFrame(daily_data[1:], columns=headers)
-        
-        names = df_daily['이름'].tolist()
-        name_col_data = [['이름']] + [[n] for n in names]
-        ws_monthly.update(range_name=f"A1:A{len(name_col_data)}", values=name_col_data)
-        
+        get_write_queue().flush()  # 방금 누른 체크까지 포함
+        rows, header_row = storage.batch_read([("원생명단", None), ("월간출석부", "1:1")])
+        if len(rows) < 2: return False, "데이터가 없습니다."
         today_str = get_korea_time().strftime("%m/%d")
-        log_column = [today_str]
-        
-        for idx, row in df_daily.iterrows():
-            status = row.get('출석확인', '')
-            note = str(row.get('비고', '')).strip()
-            if status == '출석': mark = 'O'
-            elif note and note != 'nan' and note != '': mark = note
-            elif status == '결석': mark = 'X'
-            else: mark = ''
-            log_column.append(mark)
-            
-        header_row = ws_monthly.row_values(1)
-        next_col_idx = len(header_row) + 1
-        col_letter = gspread.utils.rowcol_to_a1(1, next_col_idx).replace('1', '')
-        range_str = f"{col_letter}1:{col_letter}{len(log_column)}"
-        ws_monthly.update(range_name=range_str, values=[[val] for val in log_column])
-        return True, f"{today_str} 저장 완료!"
+        plan = plan_day_close(rows, header_row[0] if header_row else [], today_str)
+        if not plan: return True, f"{today_str} 은(는) 이미 마감되었습니다."
+        storage.batch_write_many(get_roster_sync().stamp(plan))
+        get_roster_sync().apply(plan["원생명단"])
+        try: get_attendance_history().record_day(get_korea_time().date(), rows)
+        except Exception as e: return True, f"{today_str} 저장 및 초기화 완료! (로컬 이력 저장 실패: {e})"
+        return True, f"{today_str} 저장 및 초기화 완료! 👋"
+    except Exception as e:
+        return False, f"오류: {e}"
+    finally: lock.release()
+
+# 출석 이력: 월간출석부와 별도로 로컬에 하루 한 개 Parquet 파일 (원생 키, 날짜, 기호만 저장)
+class AttendanceHistory:
+    COLUMNS = ['key', '이름', '수련부', 'mark', 'present', 'date']
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._df = None  # 전체 이력 (처음 조회할 때 한 번 읽고 이후엔 메모리에서 갱신)
+
+    def _load(self):
+        if self._df is None:
+            files = sorted(f for f in os.listdir(self.path) if f.endswith(".parquet")) if os.path.isdir(self.path) else []
+            frames = [pd.read_parquet(os.path.join(self.path, f)) for f in files]
+            self._df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.COLUMNS).astype({'present': bool, 'date': 'datetime64[ms]'})
+        return self._df
+
+    def record_day(self, day, rows):
+        # 마감한 원생명단 행 -> 기록이 있는 원생만 저장. 같은 날 다시 마감하면 원생 키 기준으로 그 날 기록에 합침
+        df = pd.DataFrame(rows[1:], columns=rows[0])
+        marks = compute_day_marks(df)
+        records = pd.DataFrame({
+            'key': make_student_keys(df),
+            '이름': df['이름'],
+            '수련부': df['수련부'].astype(str) if '수련부' in df.columns else '',
+            'mark': marks,
+            'present': marks == 'O',
+            'date': pd.Timestamp(day),
+        })[marks != '']
+        with self._lock:
+            history = self._load()
+            same_day = history['date'] == pd.Timestamp(day)
+            earlier = history[same_day & ~history['key'].isin(records['key'])]
+            records = pd.concat([earlier.astype({'수련부': str}), records], ignore_index=True)
+            records['수련부'] = records['수련부'].astype('category')
+            os.makedirs(self.path, exist_ok=True)
+            records.to_parquet(os.path.join(self.path, f"{day.isoformat()}.parquet"), index=False)
+            self._df = pd.concat([history[~same_day], records], ignore_index=True)
+
+    def frame(self, days, today):
+        with self._lock: history = self._load()
+        return history[history['date'] > pd.Timestamp(today) - pd.Timedelta(days=days)]
+
+@branch_resource
+def get_attendance_history():
+    return AttendanceHistory(branch_path(ATTENDANCE_HISTORY_DIR))
+
+def class_attendance_rates(frame):
+    rates = frame.groupby('수련부', observed=True)['present'].agg(['sum', 'count'])
+    rates['출석률(%)'] = (rates['sum'] / rates['count'] * 100).round(1)
+    return rates.rename(columns={'sum': '출석', 'count': '기록'}).reset_index()
+
+def student_streaks(frame):
+    # 연속 출석 = 마지막 결석/사유 이후의 출석 일수 (원생 키를 정수 코드로 바꿔서 groupby)
+    codes = pd.Series(pd.factorize(frame['key'])[0], index=frame.index)
+    missed = ~frame['present']
+    last_miss = frame['date'].where(missed).groupby(codes).max()
+    after = frame['date'].to_numpy() > last_miss.reindex(codes.to_numpy()).fillna(pd.Timestamp.min).to_numpy()
+    latest = frame[~codes.duplicated(keep='last')]
+    summary = latest[['이름', '수련부']].set_axis(codes[latest.index].to_numpy())
+    summary['결석'] = missed.groupby(codes).sum()
+    summary['연속출석'] = pd.Series(frame['present'].to_numpy() & after).groupby(codes.to_numpy()).sum()
+    summary['최근결석일'] = last_miss.dt.strftime("%Y-%m-%d").fillna('-')
+    return summary.reset_index(drop=True).sort_values(['연속출석', '이름'], ascending=[False, True])
+
+def absence_trend(frame):
+    return frame.assign(결석=~frame['present']).groupby('date')['결석'].sum()
+
+# 6. 장기일정 일괄 반영 (하루 1회 / 관리자 수동 실행)
+def plan_long_term_updates(df, today_str, cols):
+    # 만료된 장기일정은 지우고, 기간 중인데 출석 체크가 비어 있으면 자동 결석 -> (행, 열, 값) 목록
+    if '장기일정' not in df.columns: return []
+    parts = df['장기일정'].astype(str).str.extract(r'^\s*([^~:]+?)\s*~\s*([^:]+?)\s*:(.*)$')
+    start, end, reason = parts[0], parts[1], parts[2].fillna('')
+    status = df['출석확인'].astype(str).str.strip() if '출석확인' in df.columns else pd.Series('', index=df.index)
+    expired = end.notna() & (end < today_str)
+    active = start.notna() & (start <= today_str) & (end >= today_str) & (status == '')
+    
+    updates = []
+    rows = df.index.to_numpy() + 2  # df 인덱스 + 2 = 시트 행
+    if "장기일정" in cols:
+        updates += [(r, cols["장기일정"], "") for r in rows[expired.to_numpy()].tolist()]
+    for col_name in ["출석확인", "비고", "등원확인", "하원확인"]:
+        if col_name not in cols: continue
+        values = reason[active] if col_name == "비고" else pd.Series("결석", index=reason[active].index)
+        updates += [(r, cols[col_name], v) for r, v in zip(rows[active.to_numpy()].tolist(), values)]
+    return updates
+
+def reconcile_long_term_schedules():
+    storage = get_storage()
+    if not storage: return False, "서버 연결 실패"
+    try:
+        rows = storage.read_sheet("원생명단")
+        if len(rows) < 2: return True, "반영할 장기일정이 없습니다."
+        df = build_roster_df(rows)
+        today_str = get_korea_time().strftime("%Y-%m-%d")
+        updates = plan_long_term_updates(df, today_str, get_address_index().cols)
+        get_roster_sync().load_rows(rows)  # 방금 읽은 전체 행을 스냅샷으로 -> 첫 화면에서 다시 읽지 않음
+        if updates:
+            storage.batch_write_many(get_roster_sync().stamp({"원생명단": updates}))
+            get_roster_sync().apply(updates)
+        return True, f"장기일정 {len(updates)}칸 반영 완료"
     except Exception as e:
         return False, f"오류: {e}"
 
+@branch_resource
+def get_reconcile_state():
+    return {"date": None, "lock": threading.Lock(), "message": "", "tried_at": 0.0}
+
+RECONCILE_RETRY_SEC = 60  # 실패(오프라인 등)하면 이 간격으로만 다시 시도
+
+def run_daily_reconciliation():
+    # 그날 첫 접속한 세션 하나만 실행, 나머지는 기다리지 않고 통과
+    state = get_reconcile_state()
+    today_str = get_korea_time().strftime("%Y-%m-%d")
+    if state["date"] == today_str or time.time() - state["tried_at"] < RECONCILE_RETRY_SEC: return
+    if not state["lock"].acquire(blocking=False): return
+    try:
+        if state["date"] != today_str:
+            ok, msg = run_with_priority(PRIORITY_BACKGROUND, reconcile_long_term_schedules)
+            state["message"] = msg
+            state["tried_at"] = time.time()
+            if ok: state["date"] = today_str
+    finally: state["lock"].release()
+
 # ==========================================
 # [데이터 로드 함수]
 # ==========================================
-@st.cache_data(ttl=5) 
-def load_fast_data():
-    client = get_gspread_client()
-    if not client: return pd.DataFrame()
-    try:
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet("원생명단")
-        rows = worksheet.get_all_values()
-        if len(rows) < 2: return pd.DataFrame()
-        
-        headers = rows[0]
-        data = rows[1:]
-        df = pd.DataFrame(data, columns=headers)
-        df = df.loc[:, ~df.columns.str.match(r'^\s*$')]
+def build_roster_df(rows):
+    headers = rows[0]
+    df = pd.DataFrame(rows[1:], columns=headers)
+    df = df.loc[:, ~df.columns.str.match(r'^\s*$')]
+    # 주소 인덱스는 퇴원/휴관생 행까지 포함해서 만들어야 행 번호가 맞음
+    if '이름' in df.columns:
+        df['_key'] = make_student_keys(df)
+        get_address_index().sync(headers, df['_key'].tolist())
+    if '상태' in df.columns:
+        df = df[~df['상태'].str.contains('휴관|퇴원|중단|쉬는', case=False, na=False)]
+    return df
+
+# 원생명단 증분 동기화: 평소엔 이름 열 + 체크 열만 받아서 바뀐 칸만 패치
+# 모든 세션이 같은 스냅샷을 공유하고, 우리 쪽 쓰기는 다시 읽지 않고 스냅샷에 바로 반영
+# 수정 표시 범위(roster_revision_range, 예: "동기화!A1:B1")를 두면 5초마다 그 두 칸만 읽고 바뀌었을 때만 받음
+#   첫 칸: 앱이 원생명단을 쓸 때마다 같은 호출로 새 값을 씀 -> 바뀌면 체크 열 증분
+#   둘째 칸: 시트에서 직접 고칠 때마다 바뀌는 값 (onEdit Apps Script 등) -> 바뀌면 전체
+# 수정 표시가 없으면 체크 열이 아닌 열(상태/장기일정/차량 등)을 시트에서 고친 것은 최대 ROSTER_FULL_SYNC_SEC 늦게 보임
+ROSTER_TTL = 5
+ROSTER_FAST_COLS = ["등원확인", "하원확인", "출석확인", "비고"]
+ROSTER_FULL_SYNC_SEC = get_setting("roster_full_sync_sec", 300)  # 이 주기마다 (또는 행/헤더가 바뀌면) 전체 다시 읽기
+ROSTER_REVISION_RANGE = get_setting("roster_revision_range", "")
+
+class RosterSync:
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self._lock = threading.Lock()
+        self.rows = None  # 마지막 전체 스냅샷 (get_all_values 형태)
+        self.df = pd.DataFrame()
+        self.full_at = 0.0
+        self.synced_at = 0.0
+        self.base_version = 0  # 전체 다시 읽어서 체크 열이 아닌 값이 바뀌었을 때만 증가 (일정/생일/이름 인덱스 캐시 키)
+        self.revision = None  # 마지막으로 읽은 수정 표시 (앱 쓰기, 시트 직접 수정)
+        self._stamps = collections.deque(maxlen=50)  # 이 서버가 쓴 수정 표시 -> 읽어 와도 다시 받지 않음
+        self.stats = collections.Counter()  # full / delta / unchanged
+        if ROSTER_REVISION_RANGE:
+            name, _, a1 = ROSTER_REVISION_RANGE.partition('!')
+            self.revision_request = (name.strip("'"), a1)
+            self.revision_cell = (name.strip("'"), *gspread.utils.a1_to_rowcol(a1.split(':')[0]))
+        else: self.revision_request = self.revision_cell = None
+
+    def invalidate(self):
+        with self._lock: self.rows = None
+
+    def plan(self):
+        # 다음 동기화에 읽을 범위: 신선하면 None, 스냅샷이 없거나 오래됐으면 시트 전체, 아니면 헤더 행 + 이름/체크 열
+        with self._lock:
+            now = time.time()
+            if self.rows is not None and now - self.synced_at < ROSTER_TTL: return None
+            if self.rows is None or now - self.full_at > ROSTER_FULL_SYNC_SEC or '이름' not in self.rows[0]: return self.full_plan()
+            if self.revision_request and self.revision is not None: return self._with_revision({"mode": "probe", "requests": []})
+            return self._delta_plan()
+
+    def _delta_plan(self):
+        headers = self.rows[0]
+        cols = [headers.index('이름')] + [headers.index(c) for c in ROSTER_FAST_COLS if c in headers]
+        letters = [gspread.utils.rowcol_to_a1(1, c + 1)[:-1] for c in cols]
+        return self._with_revision({"mode": "delta", "cols": cols, "requests": [(self.sheet_name, "1:1")] + [(self.sheet_name, f"{l}2:{l}") for l in letters]})
+
+    def full_plan(self):
+        return self._with_revision({"mode": "full", "requests": [(self.sheet_name, None)]})
+
+    def _with_revision(self, plan):
+        # 수정 표시 두 칸을 같은 요청 끝에 붙여 읽음
+        if self.revision_request: plan.update(revision=True, requests=plan["requests"] + [self.revision_request])
+        return plan
+
+    def absorb(self, plan, fetched, at):
+        # 읽어 온 값을 스냅샷에 반영 -> 이어서 읽어야 할 계획 (다 됐으면 None)
+        # 행/헤더가 바뀌어 증분이 맞지 않거나 시트에서 직접 고쳤으면 전체, 다른 서버가 체크 열을 바꿨으면 증분
+        with self._lock:
+            revision = None
+            if plan.get("revision"):
+                row = fetched[-1][0] if fetched[-1] else []
+                fetched, revision = fetched[:-1], tuple((list(row) + ['', ''])[:2])
+            known = self.revision
+            if plan["mode"] == "full": self._load_rows(fetched[0], at)
+            elif known is not None and revision[1] != known[1]: return self.full_plan()
+            elif plan["mode"] == "probe":
+                if revision[0] != known[0] and revision[0] not in self._stamps: return self._delta_plan()
+                self.stats["unchanged"] += 1
+            elif not self._delta(plan["cols"], fetched): return self.full_plan()
+            if revision: self.revision = revision
+            self.synced_at = at
+            return None
+
+    def load_rows(self, rows, at=None):
+        # 다른 곳(장기일정 반영, 디스크 스냅샷 등)에서 이미 읽은 전체 행을 스냅샷으로 사용 (수정 표시는 다음 증분 때 읽음)
+        self.absorb({"mode": "full", "requests": []}, [rows], at or time.time())
+
+    def stamp(self, updates_by_sheet):
+        # 원생명단을 바꾸는 쓰기에 앱 수정 표시를 같이 씀 (같은 호출) -> 다른 서버는 수정 표시만 보고 증분을 받음
+        if not self.revision_cell or not updates_by_sheet.get(self.sheet_name): return updates_by_sheet
+        name, r, c = self.revision_cell
+        token = f"{time.time():.3f}-{random.getrandbits(32):08x}"
+        self._stamps.append(token)
+        return {**updates_by_sheet, name: updates_by_sheet.get(name, []) + [(r, c, token)]}
+
+    def snapshot(self):
+        # 표와 그 표를 만든 동기화 버전을 함께 (따로 읽으면 그 사이 전체 동기화가 끼어들 수 있음)
+        with self._lock: return self.df.copy(), self.base_version
+
+    def export(self):
+        # 디스크 스냅샷용: (전체 행 복사본, 마지막 동기화 시각)
+        with self._lock: return ([list(r) for r in self.rows] if self.rows is not None else None), self.synced_at
+
+    def age(self):
+        with self._lock: return None if self.rows is None else time.time() - self.synced_at
+
+    def cells(self, keys):
+        # [(행, 열)] -> 마지막으로 동기화한(우리 쓰기 반영 포함) 시트 값. 스냅샷에 없는 칸은 빠짐
+        with self._lock:
+            if self.rows is None: return {}
+            return {(r, c): self.rows[r - 1][c - 1] for r, c in keys if 2 <= r <= len(self.rows) and c <= len(self.rows[r - 1])}
+
+    def apply(self, updates):
+        # 시트에 반영된 (행, 열, 값)을 스냅샷에 패치 (df 인덱스 + 2 = 시트 행)
+        with self._lock:
+            if self.rows is None: return
+            headers = self.rows[0]
+            for r, c, v in updates:
+                if not (2 <= r <= len(self.rows) and c <= len(headers)): continue
+                self.rows[r - 1][c - 1] = v
+                if (r - 2) in self.df.index and headers[c - 1] in self.df.columns: self.df.at[r - 2, headers[c - 1]] = v
+
+    def _load_rows(self, rows, at):
+        # 백그라운드 전체 동기화가 같은 내용을 다시 읽었으면 버전 유지 -> 렌더 중인 세션의 인덱스 캐시가 매번 비지 않음
+        if self._base_values(rows) != self._base_values(self.rows): self.base_version += 1
+        self.rows = rows
+        self.df = build_roster_df(rows) if len(rows) >= 2 else pd.DataFrame()
+        self.full_at = at
+        self.stats["full"] += 1
+
+    @staticmethod
+    def _base_values(rows):
+        # 헤더 + 체크 열을 뺀 값 (인덱스들이 보는 부분)
+        if rows is None: return None
+        keep = [i for i, h in enumerate(rows[0]) if h not in ROSTER_FAST_COLS]
+        return [rows[0]] + [[r[i] if i < len(r) else '' for i in keep] for r in rows[1:]]
+
+    def _delta(self, cols, fetched):
+        # 헤더 행이 그대로고 이름 열이 같을 때만 체크 열 값을 패치
+        headers = self.rows[0]
+        head_now = fetched[0][0] if fetched[0] else []
+        if head_now != headers[:len(head_now)] or any(h.strip() for h in headers[len(head_now):]): return False
+        n = len(self.rows) - 1
+        columns = []
+        for vr in fetched[1:]:
+            col = [r[0] if r else '' for r in vr]
+            if len(col) > n: return False
+            columns.append(col + [''] * (n - len(col)))
+        if columns[0] != [r[cols[0]] for r in self.rows[1:]]: return False
         
-        if '상태' in df.columns:
-            df = df[~df['상태'].str.contains('휴관|퇴원|중단|쉬는', case=False, na=False)]
-            
-        # 장기일정 자동 적용
-        if '장기일정' in df.columns:
-            today_str = get_korea_time().strftime("%Y-%m-%d")
-            updates_made = False
-            for i, row in df.iterrows():
-                schedule = str(row.get('장기일정', '')).strip()
-                current_status = str(row.get('출석확인', '')).strip()
-                
-                if schedule and "~" in schedule and ":" in schedule:
-                    try:
-                        dates, reason = schedule.split(":")
-                        start_date, end_date = dates.split("~")
-                        start_date = start_date.strip()
-                        end_date = end_date.strip()
-                        
-                        if today_str > end_date:
-                            cell = worksheet.find(row['이름'])
-                            if cell:
-                                col_idx = worksheet.find("장기일정").col
-                                worksheet.update_cell(cell.row, col_idx, "")
-                                updates_made = True
-                        elif start_date <= today_str <= end_date:
-                            if current_status == '':
-                                cell = worksheet.find(row['이름'])
-                                if cell:
-                                    r = cell.row
-                                    # API 최적화: find 반복 제거
-                                    head = worksheet.row_values(1)
-                                    cmap = {n: j+1 for j, n in enumerate(head)}
-                                    
-                                    if "출석확인" in cmap: worksheet.update_cell(r, cmap["출석확인"], "결석")
-                                    if "비고" in cmap: worksheet.update_cell(r, cmap["비고"], reason)
-                                    if "등원확인" in cmap: worksheet.update_cell(r, cmap["등원확인"], "결석")
-                                    if "하원확인" in cmap: worksheet.update_cell(r, cmap["하원확인"], "결석")
-                                    updates_made = True
-                    except: pass
-            
-            if updates_made:
-                load_fast_data.clear()
-                # Reload logic...
-                rows = worksheet.get_all_values()
-                headers = rows[0]
-                data = rows[1:]
-                df = pd.DataFrame(data, columns=headers)
-                df = df.loc[:, ~df.columns.str.match(r'^\s*$')]
-                if '상태' in df.columns:
-                    df = df[~df['상태'].str.contains('휴관|퇴원|중단|쉬는', case=False, na=False)]
-        return df
-    except: return pd.DataFrame()
+        changed = 0
+        for c, col in zip(cols[1:], columns[1:]):
+            name = headers[c]
+            for i, v in enumerate(col):
+                if self.rows[i + 1][c] != v:
+                    self.rows[i + 1][c] = v
+                    if i in self.df.index: self.df.at[i, name] = v
+                    changed += 1
+        self.stats["delta" if changed else "unchanged"] += 1
+        return True
 
-@st.cache_data(ttl=600)
-def load_slow_data(sheet_name):
-    client = get_gspread_client()
-    if not client: return pd.DataFrame()
-    try:
-        sh = client.open_by_key(SHEET_ID)
-        worksheet = sh.worksheet(sheet_name)
-        rows = worksheet.get_all_values()
-        if len(rows) < 2: return pd.DataFrame() 
-        headers = rows[0]
-        data = rows[1:]
-        df = pd.DataFrame(data, columns=headers)
-        return df
-    except: return pd.DataFrame()
+@branch_resource
+def get_roster_sync():
+    return RosterSync("원생명단")
+
+# 스냅샷 로더: 필요한 시트 중 오래된 것만 골라 values_batch_get 한 번으로 읽고, 같은 시각으로 스냅샷을 찍음
+# 원생명단은 ROSTER_TTL(5초)마다 체크 열만 증분, 나머지 시트는 SLOW_SHEET_TTL(600초)마다 전체
+# 연결이 끊기면 마지막 스냅샷(메모리, 서버를 새로 켰으면 디스크)을 계속 보여 주고 OFFLINE_RETRY_SEC 마다 다시 시도
+# 갱신 주기가 지난 스냅샷도 MAX_STALE_SEC 까지는 바로 보여 주고, 새로 받기는 뒤에서 한 번만 (나머지 세션은 기다리지 않음)
+SLOW_SHEET_TTL = 600
+SNAPSHOT_SAVE_SEC = 30  # 디스크 스냅샷을 다시 쓰는 최소 간격
+
+class SnapshotLoader:
+    def __init__(self, roster, path):
+        self.roster = roster
+        self.path = path  # 디스크 스냅샷 파일
+        self._lock = threading.Lock()        # 스냅샷 보호
+        self._fetch_lock = threading.Lock()  # 읽기는 한 번에 하나 (여러 세션이 같은 시트를 동시에 읽지 않게)
+        self.frames = {}      # 시트 이름 -> DataFrame
+        self.raw = {}         # 시트 이름 -> 읽은 행 그대로 (디스크 스냅샷용)
+        self.fetched_at = {}  # 시트 이름 -> 스냅샷 시각 (한 번에 읽은 시트는 같은 시각)
+        self.round_trips = 0
+        self.failed_at = 0.0  # 마지막 연결 오류 시각 (0 = 연결됨)
+        self.last_error = ""
+        self.saved_at = 0.0
+        self.refreshing = set()  # 백그라운드로 새로 받는 중인 시트
+
+    def invalidate(self, name=None):
+        with self._lock:
+            for n in ([name] if name else list(self.fetched_at)): self.fetched_at.pop(n, None)
+        if name in (None, self.roster.sheet_name): self.roster.invalidate()
+
+    def _plan(self, names):
+        now = time.time()
+        with self._lock: slow = [n for n in names if n != self.roster.sheet_name and now - self.fetched_at.get(n, 0) > SLOW_SHEET_TTL]
+        roster_plan = self.roster.plan() if self.roster.sheet_name in names else None
+        return slow, roster_plan, [(n, None) for n in slow] + (roster_plan["requests"] if roster_plan else [])
+
+    def get(self, storage, names):
+        slow, roster_plan, requests = self._plan(names)
+        waited = []
+        if requests and time.time() - self.failed_at >= OFFLINE_RETRY_SEC:
+            due = slow + ([self.roster.sheet_name] if roster_plan else [])
+            if all(self._servable(n) for n in due):
+                self._refresh_async(storage, due)
+            else:
+                waited = due  # 스냅샷이 없거나 너무 오래됨 -> 받을 때까지 기다림
+                self._refresh(storage, names)
+        if self.failed_at: self._restore(names)
+        metrics = get_metrics()
+        for n in names: metrics.cache_result("load_fast_data" if n == self.roster.sheet_name else "load_slow_data", n not in waited)
+        frames = {n: self.frame(n) for n in names if n != self.roster.sheet_name}
+        version = None
+        if self.roster.sheet_name in names: frames[self.roster.sheet_name], version = self.roster.snapshot()
+        return frames, version
+
+    def _age(self, name):
+        if name == self.roster.sheet_name: return self.roster.age()
+        with self._lock: return time.time() - self.fetched_at[name] if name in self.fetched_at else None
+
+    def _servable(self, name):
+        age = self._age(name)
+        ttl = ROSTER_TTL if name == self.roster.sheet_name else SLOW_SHEET_TTL
+        return age is not None and age <= ttl + MAX_STALE_SEC
+
+    def _refresh(self, storage, names):
+        # 한 번에 하나만 읽음. 기다리는 동안 다른 세션이 읽었으면 다시 계획해서 건너뜀
+        with self._fetch_lock:
+            slow, roster_plan, requests = self._plan(names)
+            if not requests or time.time() - self.failed_at < OFFLINE_RETRY_SEC: return
+            try: self._fetch(storage, slow, roster_plan, requests)
+            except Exception as e:
+                if not is_transient_error(e): raise
+                self.failed_at, self.last_error = time.time(), str(e)
+
+    def _refresh_async(self, storage, due):
+        # 이미 누가 받는 중인 시트는 빼고 나머지만 백그라운드로 (그동안은 이전 스냅샷)
+        with self._lock:
+            due = [n for n in due if n not in self.refreshing]
+            if not due: return
+            self.refreshing.update(due)
+        def run():
+            try: self._refresh(storage, due)
+            except Exception as e: self.last_error = str(e)
+            finally:
+                with self._lock: self.refreshing.difference_update(due)
+        start_branch_thread(run)
+
+    def _fetch(self, storage, slow, roster_plan, requests):
+        fetched = storage.batch_read(requests)
+        at = time.time()
+        self.round_trips += 1
+        self.failed_at, self.last_error = 0.0, ""  # 다시 연결됨
+        for name, rows in zip(slow, fetched): self._store(name, rows, at)
+        follow = self.roster.absorb(roster_plan, fetched[len(slow):], at) if roster_plan else None
+        while follow:
+            # 수정 표시가 바뀌었거나 증분이 안 맞음 -> 원생명단만 한 번 더 (증분 또는 전체)
+            follow = self.roster.absorb(follow, storage.batch_read(follow["requests"]), time.time())
+            self.round_trips += 1
+        self._save()
+
+    def _store(self, name, rows, at):
+        with self._lock:
+            self.frames[name] = pd.DataFrame(rows[1:], columns=rows[0]) if len(rows) >= 2 else pd.DataFrame()
+            self.raw[name] = rows
+            self.fetched_at[name] = at
+
+    def _save(self):
+        # 마지막으로 읽은 내용을 디스크에 (백그라운드, 임시 파일에 쓴 뒤 바꿔치기)
+        if time.time() - self.saved_at < SNAPSHOT_SAVE_SEC: return
+        self.saved_at = time.time()
+        with self._lock: data = {n: {"at": self.fetched_at[n], "rows": rows} for n, rows in self.raw.items() if n in self.fetched_at}
+        rows, at = self.roster.export()
+        if rows is not None: data[self.roster.sheet_name] = {"at": at, "rows": rows}
+        def write():
+            try:
+                with open(self.path + ".tmp", "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError as e: self.last_error = f"스냅샷 저장 실패: {e}"
+        threading.Thread(target=write, daemon=True).start()
+
+    def _restore(self, names):
+        # 메모리에 아직 없는 시트만 디스크 스냅샷에서 (서버를 오프라인 상태로 새로 켠 경우)
+        with self._lock: missing = [n for n in names if n != self.roster.sheet_name and n not in self.frames]
+        if self.roster.sheet_name in names and self.roster.age() is None: missing.append(self.roster.sheet_name)
+        if not missing or not os.path.exists(self.path): return
+        try:
+            with open(self.path, encoding="utf-8") as f: saved = json.load(f)
+        except (OSError, ValueError): return
+        for name in missing:
+            if name not in saved: continue
+            rows, at = saved[name]["rows"], saved[name]["at"]
+            if name == self.roster.sheet_name: self.roster.load_rows(rows, at)
+            else: self._store(name, rows, at)
+
+    def age(self, names):
+        # 보여 주는 데이터 중 가장 오래된 스냅샷의 나이(초). 아직 아무것도 없으면 None
+        ages = [a for a in map(self._age, names) if a is not None]
+        return max(ages) if ages else None
+
+    def frame(self, name):
+        if name == self.roster.sheet_name: return self.roster.snapshot()[0]
+        with self._lock: return self.frames.get(name, pd.DataFrame()).copy()
+
+@branch_resource
+def get_snapshot_loader():
+    return SnapshotLoader(get_roster_sync(), branch_path(SNAPSHOT_PATH))
+
+def load_sheets(names):
+    # 여러 시트를 한 번의 요청으로 -> (시트별 표, 원생명단 버전). 실패하면 오류를 보이고 빈 표
+    storage = get_storage()
+    if not storage or not names: return {n: pd.DataFrame() for n in names}, None
+    try: return get_snapshot_loader().get(storage, names)
+    except Exception as e:
+        st.error(f"시트를 불러오지 못했습니다 ({', '.join(names)}): {e}")
+        return {n: pd.DataFrame() for n in names}, None
+
+def load_fast_data():
+    frames, version = load_sheets(["원생명단"])
+    return frames["원생명단"], version
+
+# 상담일지는 추가만 되는 시트 -> 원생별 인덱스를 두고 마지막 동기화 이후 추가된 행만 읽음
+CONSULT_SYNC_SEC = 10
+
+class ConsultationIndex:
+    def __init__(self, sheet_name):
+        self.sheet_name = sheet_name
+        self._lock = threading.Lock()
+        self.headers = None
+        self.next_row = 2     # 다음에 읽을 시트 행
+        self.by_student = collections.defaultdict(list)
+        self._local = set()   # 이 서버에서 추가해서 인덱스에 이미 넣은 시트 행 번호 (아직 읽어오지 않은 것)
+        self.synced_at = 0.0
+
+    def invalidate(self):
+        with self._lock: self.headers = None
+
+    def on_append(self, sheet_name, row, row_num):
+        # 쓰기 큐가 이 시트에 행을 넣었으면 다시 읽지 않아도 바로 보이게 (행 번호를 모르면 다음 동기화 때)
+        if sheet_name == self.sheet_name and row_num: self.add_local(row, row_num)
+
+    def add_local(self, row, row_num):
+        with self._lock:
+            if self.headers is None or row_num < self.next_row: return
+            self._local.add(row_num)
+            self._add(row)
+
+    def _add(self, row):
+        if '이름' not in self.headers: return
+        row = list(row) + [''] * (len(self.headers) - len(row))
+        self.by_student[row[self.headers.index('이름')]].append(row[:len(self.headers)])
+
+    def sync(self, storage):
+        with self._lock:
+            hit = self.headers is not None and time.time() - self.synced_at < CONSULT_SYNC_SEC
+            get_metrics().cache_result("load_consultation_logs", hit)
+            if hit: return
+            if self.headers is None:
+                rows = storage.read_sheet(self.sheet_name)
+                self.headers = rows[0] if rows else []
+                self.by_student = collections.defaultdict(list)
+                self._local = set()
+                self.next_row = 2
+                new_rows = rows[1:]
+            else:
+                last_col = gspread.utils.rowcol_to_a1(1, max(len(self.headers), 1))[:-1]
+                new_rows = storage.read_range(self.sheet_name, f"A{self.next_row}:{last_col}")
+            for row_num, row in enumerate(new_rows, self.next_row):
+                if row_num in self._local: self._local.discard(row_num)  # 직접 추가해 둔 행 -> 이미 인덱스에 있음
+                elif any(str(v).strip() for v in row): self._add(row)
+            self.next_row += len(new_rows)
+            self.synced_at = time.time()
+
+    def lookup(self, student_name):
+        with self._lock:
+            rows = list(self.by_student.get(student_name, []))
+        if not rows: return pd.DataFrame()
+        return pd.DataFrame(rows, columns=self.headers).iloc[::-1]
+
+@branch_resource
+def get_consultation_index():
+    return ConsultationIndex("상담일지")
 
 def load_consultation_logs(student_name):
-    client = get_gspread_client()
+    storage = get_storage()
     try:
-        sh = client.open_by_key(SHEET_ID)
-        ws = sh.worksheet("상담일지")
-        rows = ws.get_all_values()
-        if len(rows) < 2: return pd.DataFrame()
-        df = pd.DataFrame(rows[1:], columns=rows[0])
-        target_df = df[df['이름'] == student_name]
-        return target_df.iloc[::-1]
-    except: return pd.DataFrame()
+        index = get_consultation_index()
+        index.sync(storage)
+        return index.lookup(student_name)
+    except Exception as e:
+        st.error(f"상담일지를 불러오지 못했습니다: {e}")
+        return pd.DataFrame()
 
 # [Helper Functions]
-def parse_schedule_for_today(raw_text, today_char):
+WEEKDAY_CHARS = ["월", "화", "수", "목", "금", "토", "일"]
+SCHEDULE_COLS = ['등원차량', '등원시간', '등원장소', '하원차량', '하원시간', '하원장소']
+
+def parse_weekly_schedule(raw_text):
+    # "1호차(월수금),2호차(화목)" -> ({"월": "1호차", "화": "2호차", ...}, 문제 설명)
     raw_text = str(raw_text).strip()
-    if not raw_text: return ""
-    if "(" not in raw_text: return raw_text
-    settings = raw_text.split(',')
-    for setting in settings:
+    if not raw_text: return {}, ""
+    if "(" not in raw_text:
+        return {d: raw_text for d in WEEKDAY_CHARS}, ("괄호 짝이 맞지 않음" if ")" in raw_text else "")
+    by_day, problems = {}, []
+    for setting in raw_text.split(','):
         if "(" in setting and ")" in setting:
             parts = setting.split('(')
             val = parts[0].strip()
             days = parts[1].replace(')', '').strip()
-            if today_char in days: return val
-    return ""
-
-def extract_birth_month(date_str):
-    digits = re.sub(r'[^0-9]', '', str(date_str))
-    if len(digits) == 8: return int(digits[4:6])
-    elif len(digits) == 6: return int(digits[2:4])
-    elif len(digits) == 4: return int(digits[0:2])
-    return 0
-
-def extract_birth_day(date_str):
-    digits = re.sub(r'[^0-9]', '', str(date_str))
-    if len(digits) == 8: return int(digits[6:8])
-    elif len(digits) == 6: return int(digits[4:6])
-    elif len(digits) == 4: return int(digits[2:4])
-    return 0
-
-def get_birthday_weekday(month, day):
-    try:
-        current_year = datetime.now().year
-        date_obj = datetime(current_year, int(month), int(day))
-        weekdays = ["(월)", "(화)", "(수)", "(목)", "(금)", "(토)", "(일)"]
-        return weekdays[date_obj.weekday()]
-    except: return ""
+            matched = [d for d in WEEKDAY_CHARS if d in days]
+            if not val or not matched or len(parts) > 2: problems.append(setting.strip())
+            for d in matched: by_day.setdefault(d, val)  # 먼저 나온 설정 우선
+        elif setting.strip(): problems.append(setting.strip())
+    return by_day, (f"해석 불가: {', '.join(problems)}" if problems else "")
+
+def roster_key(version):
+    # 일정/생일/이름 인덱스 캐시 키: 지점 + 표와 함께 받은 원생명단 전체 동기화 버전
+    return current_branch.get(), version
+
+@st.cache_resource(max_entries=4 * len(BRANCHES))
+def build_schedule_index(version, _df):
+    # 스냅샷당 한 번: 요일별 (차량, 시간, 장소) 표 + 해석 못 한 일정 목록
+    days = {d: pd.DataFrame('', index=_df.index, columns=SCHEDULE_COLS) for d in WEEKDAY_CHARS}
+    problems = []
+    for col in SCHEDULE_COLS:
+        if col not in _df.columns: continue
+        raw = _df[col].astype(str).str.strip()
+        parsed = {text: parse_weekly_schedule(text) for text in raw.unique()}
+        for d in WEEKDAY_CHARS:
+            days[d][col] = raw.map({text: by_day.get(d, "") for text, (by_day, _) in parsed.items()})
+        bad = raw.map({text: problem for text, (_, problem) in parsed.items()})
+        for i in bad[bad != ''].index:
+            problems.append({'이름': _df.at[i, '이름'], '컬럼': col, '값': raw[i], '문제': bad[i]})
+    return days, pd.DataFrame(problems, columns=['이름', '컬럼', '값', '문제'])
+
+WEEKDAY_LABELS = ["(월)", "(화)", "(수)", "(목)", "(금)", "(토)", "(일)"]
+
+@st.cache_resource(max_entries=4 * len(BRANCHES))
+def build_birthday_index(version, today, _df):
+    # 스냅샷(+날짜)당 한 번: 생일/생년 컬럼 -> 월/일/올해 요일/다음 생일 + (월, 일) 인덱스
+    birth_cols = [c for c in _df.columns if '생일' in c or '생년' in c]
+    if not birth_cols: return None, {}, {}
+    digits = _df[birth_cols[0]].astype(str).str.replace(r'[^0-9]', '', regex=True)
+    lengths = digits.str.len()
+    month = pd.Series(0, index=_df.index)
+    day = pd.Series(0, index=_df.index)
+    # YYYYMMDD / YYMMDD / MMDD
+    for length, m0 in [(8, 4), (6, 2), (4, 0)]:
+        mask = lengths == length
+        month[mask] = digits[mask].str[m0:m0 + 2].astype(int)
+        day[mask] = digits[mask].str[m0 + 2:m0 + 4].astype(int)
+    
+    # 올해(KST) 날짜 기준 요일, 지났으면 내년이 다음 생일 (2/29 등 없는 날짜는 NaT)
+    this_year = pd.to_datetime(pd.DataFrame({'year': today.year, 'month': month, 'day': day}), errors='coerce')
+    next_year = pd.to_datetime(pd.DataFrame({'year': today.year + 1, 'month': month, 'day': day}), errors='coerce')
+    birthdays = pd.DataFrame({'birth_month': month, 'birth_day': day}, index=_df.index)
+    birthdays['birth_weekday'] = this_year.dt.weekday.map(lambda w: WEEKDAY_LABELS[int(w)] if pd.notna(w) else "")
+    birthdays['next_birthday'] = this_year.where(this_year.dt.date >= today, next_year)
+    
+    valid = birthdays[birthdays['birth_month'] > 0]
+    by_date = valid.groupby(['birth_month', 'birth_day']).groups
+    by_month = valid.groupby('birth_month').groups
+    return birthdays, by_date, by_month
+
+# [이름 검색 인덱스] 스냅샷당 한 번: 전체 이름을 한 문자열로 이어 두고 str.find 로 찾음 (정규식 아님, 입력 그대로)
+# 순위: 이름 일치 > 앞부분 일치 > 초성 앞부분 > 중간 일치 > 초성 중간 ("ㄱㅈㅇ", "김ㅈ" -> 김지안)
+CHOSEONG = "ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ"
+
+def to_choseong(text):
+    # 완성형 한글은 초성으로, 나머지 글자는 그대로 (글자 수가 같아서 위치가 그대로 맞음)
+    return ''.join(CHOSEONG[(ord(ch) - 0xAC00) // 588] if '가' <= ch <= '힣' else ch for ch in text)
+
+class NameIndex:
+    def __init__(self, df):
+        names = df['이름'].fillna('').astype(str).str.strip().str.casefold() if '이름' in df.columns else pd.Series(dtype=str)
+        self.keys = names.index.tolist()  # df 인덱스
+        self.names = names.tolist()
+        self.exact = collections.defaultdict(list)
+        for k, name in enumerate(self.names): self.exact[name].append(k)
+        self.starts = list(itertools.accumulate((len(n) + 1 for n in self.names[:-1]), initial=0))
+        self.blob = '\n'.join(self.names)
+        self.initials = '\n'.join(map(to_choseong, self.names))
+
+    def _hits(self, blob, q):
+        pos = blob.find(q)
+        while pos != -1:
+            k = bisect.bisect_right(self.starts, pos) - 1
+            yield k, pos - self.starts[k]
+            pos = blob.find(q, pos + 1)
+
+    def search(self, query):
+        # 순위대로 정렬된 df 인덱스 목록
+        q = query.strip().casefold()
+        if not q or '\n' in q or not self.names: return []
+        ranks = dict.fromkeys(self.exact.get(q, []), 0)
+        for k, off in self._hits(self.blob, q): ranks.setdefault(k, 1 if off == 0 else 3)
+        if any(c in CHOSEONG for c in q):
+            # 초성이 섞인 입력: 초성끼리 먼저 찾고, 완성된 글자는 그 글자 그대로인지 확인
+            for k, off in self._hits(self.initials, to_choseong(q)):
+                if k in ranks: continue
+                if all(c == n or c in CHOSEONG for c, n in zip(q, self.names[k][off:])): ranks[k] = 2 if off == 0 else 4
+        return [self.keys[k] for k in sorted(ranks, key=lambda k: (ranks[k], self.names[k], k))]
+
+@st.cache_resource(max_entries=4 * len(BRANCHES))
+def build_name_index(version, _df):
+    return NameIndex(_df)
+
+def search_students(df, version, query):
+    # 세 화면(출석 검색/상담/기질)이 같은 인덱스를 씀. 이름 열은 전체 동기화 때만 바뀌므로 df와 함께 받은 버전 기준
+    with metrics.timer("search_students"):
+        return [i for i in build_name_index(roster_key(version), df).search(query) if i in df.index]
+
+def pick_student(df, version, query, key):
+    # 검색어 -> 원생 한 명의 df 인덱스 (여러 명이면 순위 순으로 고르게, 없으면 None)
+    hits = search_students(df, version, query)
+    if len(hits) <= 1: return hits[0] if hits else None
+    label = lambda i: f"{df.at[i, '이름']} ({df.at[i, '수련부']}부)" if '수련부' in df.columns else df.at[i, '이름']
+    return st.selectbox(f"검색 결과 {len(hits)}명", hits, key=key, format_func=label)
+
+# 화면별로 필요한 시트: 스냅샷 로더가 오래된 것만 한 요청으로 읽음 (원생명단 5초 증분, 나머지 SLOW_SHEET_TTL)
+SLOW_SHEETS = ["공지사항", "기질가이드", "심사일정"]
+PAGE_SHEETS = {
+    "🏠 홈 대시보드": ["원생명단", "공지사항", "심사일정"],
+    "🚍 차량 운행표": ["원생명단"],
+    "📝 수련부 출석": ["원생명단"],
+    "📞 학부모 상담": ["원생명단"],
+    "📉 오늘의 결석자": ["원생명단"],
+    "🧠 기질/훈육 통합": ["원생명단", "기질가이드"],
+    "📈 승급심사 관리": ["심사일정"],
+    "🎂 이달의 생일": ["원생명단"],
+    "🔐 관리자 모드": [],
+}
+PREFETCH_INTERVAL = {"원생명단": 30}  # 초: 다른 화면용 시트를 미리 읽는 최소 간격 (나머지는 SLOW_SHEET_TTL)
+
+def load_page_data(menu):
+    # 이 화면에 필요한 시트만, 오래된 것들을 한 번의 요청으로
+    needed = PAGE_SHEETS.get(menu, ["원생명단"] + SLOW_SHEETS)
+    data = {name: pd.DataFrame() for name in ["원생명단"] + SLOW_SHEETS}
+    with metrics.timer("load_page_data"): frames, version = load_sheets(needed)
+    data.update(frames)
+    if "원생명단" in needed: data["원생명단"] = get_write_queue().overlay(data["원생명단"])
+    return data, version
+
+class Prefetcher:
+    # 지금 화면에 필요 없는 시트를 백그라운드(낮은 우선순위)로 미리 읽어서 캐시를 데워 둠
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        self._done_at = {}
+
+    def start(self, names, fn):
+        # 간격이 지난 시트만 골라서 fn(시트 목록) 한 번으로 (스냅샷 로더가 한 요청으로 묶음)
+        with self._lock:
+            due = [n for n in names if n not in self._running and time.time() - self._done_at.get(n, 0) >= PREFETCH_INTERVAL.get(n, SLOW_SHEET_TTL)]
+            self._running.update(due)
+        if not due: return
+        def run():
+            try: run_with_priority(PRIORITY_BACKGROUND, fn, due)
+            except Exception: pass  # 미리 읽기 실패는 그 화면에서 다시 읽을 때 보고됨
+            finally:
+                with self._lock:
+                    self._running.difference_update(due)
+                    for n in due: self._done_at[n] = time.time()
+        start_branch_thread(run)
+
+@branch_resource
+def get_prefetcher():
+    return Prefetcher()
+
+def prefetch_other_pages(menu):
+    storage = get_storage()
+    if not storage: return
+    needed = PAGE_SHEETS.get(menu, [])
+    others = [n for n in ["원생명단"] + SLOW_SHEETS if n not in needed]
+    get_prefetcher().start(others, lambda names: get_snapshot_loader().get(storage, names))
+
+# 이 세션의 지점: 아래의 저장소/캐시/쓰기 큐는 모두 이 지점 것
+if len(BRANCHES) > 1: st.sidebar.selectbox("🏢 지점", list(BRANCHES), key="branch")
+use_session_branch()
 
-df_students = load_fast_data() 
-df_notice = load_slow_data("공지사항")
-df_guide = load_slow_data("기질가이드")
-df_schedule = load_slow_data("심사일정")
+metrics = get_metrics()
 
 # ==========================================
-# UI 시작
+# [화면 구역] 실시간 모드에서는 이 구역들만 주기적으로 다시 그림
 # ==========================================
-with st.sidebar:
-    st.title("🥋 로운태권도")
-    st.markdown("**System Ver 74.0 (Fix & Retry)**")
-    st.write("---")
-    auto_refresh = st.toggle("실시간 모드 (10초)", value=False)
-    if auto_refresh:
-        st.caption("⚡ 10초마다 갱신 중...")
-        time.sleep(10)
-        st.rerun()
-    menu = st.radio("메뉴 선택", ["🏠 홈 대시보드", "🚍 차량 운행표", "📝 수련부 출석", "📞 학부모 상담", "📉 오늘의 결석자", "🧠 기질/훈육 통합", "📈 승급심사 관리", "🎂 이달의 생일", "🔐 관리자 모드"])
-    st.markdown("---")
-    if st.button("🔄 데이터 전체 새로고침"):
-        st.cache_data.clear()
-        st.rerun()
-
-# 1. 홈
-if menu == "🏠 홈 대시보드":
-    now = get_korea_time()
-    weekdays = ["(월)", "(화)", "(수)", "(목)", "(금)", "(토)", "(일)"]
-    st.markdown(f"<div style='text-align: right; font-size: 1.5em; font-weight: bold; margin-bottom: 20px;'>📅 {now.strftime('%m월 %d일')} {weekdays[now.weekday()]}</div>", unsafe_allow_html=True)
-    st.header("📢 오늘의 작전 브리핑")
-    
-    # 생일 알림
-    birth_cols = [c for c in df_students.columns if '생일' in c or '생년' in c]
-    if birth_cols:
-        target_col = birth_cols[0]
-        today_month = now.month
-        today_day = now.day
-        today_birthdays = df_students[
-            (df_students[target_col].apply(extract_birth_month) == today_month) &
-            (df_students[target_col].apply(extract_birth_day) == today_day)
-        ]
-        if not today_birthdays.empty:
-            names = today_birthdays['이름'].tolist()
-            st.success(f"🎂 **오늘 생일:** {', '.join(names)} 🎉 축하해주세요!")
-            st.balloons()
-
-    # 공지사항
-    if not df_notice.empty and len(df_notice.columns) >= 2:
-        recent_notices = df_notice.tail(10)
-        for i, row in recent_notices.iloc[::-1].iterrows():
-            content = str(row.iloc[1]).strip()
-            if not content: continue
-            
-            bg_color, border_color, icon = "#e8f5e9", "#4caf50", "✅"
-            if "[상담]" in content: bg_color, border_color, icon = "#ffebee", "#ef5350", "📞"
-            elif "[도복]" in content: bg_color, border_color, icon = "#e3f2fd", "#2196f3", "🥋"
-            elif "[심사]" in content or "심사" in content: bg_color, border_color, icon = "#fff9c4", "#fbc02d", "🏆"
-                
-            st.markdown(f"""<div style="background-color: {bg_color}; border-left: 5px solid {border_color}; padding: 15px; border-radius: 8px; margin-bottom: 10px; color: black; box-shadow: 0 1px 2px rgba(0,0,0,0.1);"><div style="font-weight:bold; font-size:1.05em; margin-bottom:5px;">{icon} 공지</div><div style="white-space: pre-wrap;">{content}</div></div>""", unsafe_allow_html=True)
-    else: st.info("등록된 공지사항이 없습니다.")
-    st.markdown("---")
-    if not df_schedule.empty:
-        today_test = df_schedule[pd.to_datetime(df_schedule.iloc[:,0].astype(str).str.replace('.','-'), errors='coerce').dt.date == now.date()]
-        if not today_test.empty:
-            st.error(f"🔥 **오늘 승급심사: {len(today_test)}명**")
-            for i, row in today_test.iterrows(): st.write(f" - {row.iloc[1]}")
-        else: st.success("✅ 오늘 예정된 심사는 없습니다.")
-
-# 2. 차량
-elif menu == "🚍 차량 운행표":
-    st.header("🚍 실시간 통합 운행표")
-    now = get_korea_time()
-    today_char = ["월", "화", "수", "목", "금", "토", "일"][now.weekday()]
-    st.caption(f"📅 **오늘({today_char}요일)** 기준 리스트")
-    if not df_students.empty:
-        working_df = df_students.copy()
-        for col in ['등원차량', '등원시간', '등원장소', '하원차량', '하원시간', '하원장소']:
-            if col in working_df.columns: working_df[col] = working_df[col].apply(lambda x: parse_schedule_for_today(x, today_char))
+def current_roster():
+    # 프래그먼트만 다시 실행될 때도 최신 스냅샷 + 반영 대기 중인 변경을 사용
+    df, version = load_fast_data()
+    return get_write_queue().overlay(df), version
+
+def live_section(fn):
+    # 실시간 모드면 run_every 주기로 이 구역만 재실행 (세션을 막지 않음, 데이터는 증분 동기화)
+    def timed(*args):
+        # 구역만 다시 실행될 때는 구역 단위로, 전체 실행 중이면 그 실행의 한 구간으로 기록
+        use_session_branch()
+        if metrics.in_run():
+            with metrics.timer(f"구역:{fn.__name__}"): return fn(*args)
+        run, token = metrics.begin_run(f"구역:{fn.__name__}")
+        try: return fn(*args)
+        finally: metrics.end_run(run, token)
+    return st.fragment(timed, run_every=live_interval)
+
+def rerun_section():
+    # 구역 안의 버튼이면 그 구역만, 전체 실행 중이면 전체를 다시 그림
+    try: st.rerun(scope="fragment")
+    except StreamlitAPIException: st.rerun()
+
+def row_rev(row):
+    # 위젯 키에 넣는 행 상태: 다른 기기가 값을 바꾸면 키가 바뀌므로 옛 화면에서 누른 클릭은 버려짐
+    return "|".join(str(row.get(c, '')) for c in DAY_CLOSE_COLS)
+
+def render_bulk_undo():
+    # 마지막 일괄 처리를 한 번에 되돌리는 버튼 (이 기기에서 한 것만)
+    undo = st.session_state.get('bulk_undo')
+    if undo and undo["cells"] and undo["branch"] == current_branch.get() and st.button(f"↩️ 되돌리기: {undo['label']} ({undo['students']}명)", key="bulk_undo_btn"):
+        undo_bulk_update(); rerun_section()
+
+def page_bounds(total, key):
+    # 한 페이지 분량의 시작/끝 위치. 목록(key)이 바뀌면 1페이지부터
+    pages = (total - 1) // ROSTER_PAGE_SIZE + 1
+    if pages <= 1: return 0, total
+    page = st.select_slider("페이지", options=list(range(1, pages + 1)), key=key, format_func=lambda p: f"{p} / {pages}")
+    start = (page - 1) * ROSTER_PAGE_SIZE
+    return start, min(start + ROSTER_PAGE_SIZE, total)
+
+def format_age(sec):
+    if sec < 60: return f"{sec:.0f}초"
+    if sec < 3600: return f"{sec // 60:.0f}분"
+    return f"{sec // 3600:.0f}시간 {sec % 3600 // 60:.0f}분"
+
+def render_data_status(names):
+    # 사이드바: 지금 화면 데이터가 언제 것인지 + 연결이 끊겼으면 경고
+    loader = get_snapshot_loader()
+    age = loader.age(["원생명단"] if "원생명단" in names else names)  # 공지 등 느린 시트는 10분 주기라 원생명단 기준
+    if loader.failed_at:
+        if age is None: st.sidebar.error(f"📴 시트에 연결할 수 없고 저장된 스냅샷도 없습니다: {loader.last_error}")
+        else: st.sidebar.warning(f"📴 시트에 연결할 수 없어 {format_age(age)} 전 스냅샷을 보여 줍니다 ({OFFLINE_RETRY_SEC}초마다 재시도)")
+    elif age is not None:
+        refreshing = " · 새로 받는 중" if loader.refreshing & set(names) else ""
+        st.sidebar.caption(f"🕒 데이터 기준 {format_age(age)} 전{refreshing}")
+
+def branch_summary():
+    # 지점별 현황: 각 지점이 이미 들고 있는 스냅샷/쓰기 큐/API 통계만 사용 (시트를 새로 읽지 않음)
+    # 아직 아무도 열지 않은 지점은 저장소/저널/스레드를 새로 만들지 않고 "아직 안 열림"으로만 표시
+    rows = []
+    for branch in BRANCHES:
+        loader, queue, scheduler = get_snapshot_loader.peek(branch), get_write_queue.peek(branch), get_api_scheduler.peek(branch)
+        if not (loader and queue and scheduler):
+            rows.append({"지점": branch, "데이터 기준": "아직 안 열림"})
+            continue
+        token = current_branch.set(branch)
+        try:
+            age = loader.age(["원생명단"])
+            df = queue.overlay(loader.frame("원생명단")) if age is not None else pd.DataFrame()
+            check = lambda col: df[col].astype(str).str.strip() if col in df.columns else pd.Series('', index=df.index)
+            status = check('출석확인')
+            api = scheduler.stats()
+            rows.append({"지점": branch, "재원": len(df), "출석": int((status == '출석').sum()), "결석": int((status == '결석').sum()),
+                         "미체크": int((status == '').sum()), "탑승": int((check('등원확인') == '탑승').sum() + (check('하원확인') == '탑승').sum()),
+                         "반영 대기": queue.stats()["pending"], "API 호출": sum(api["calls"].values()),
+                         "한도 대기": sum(api["throttled"].values()), "데이터 기준": f"{format_age(age)} 전" if age is not None else "아직 안 읽음"})
+        finally: current_branch.reset(token)
+    counts = ["재원", "출석", "결석", "미체크", "탑승", "반영 대기", "API 호출", "한도 대기"]
+    return pd.DataFrame(rows, columns=["지점"] + counts + ["데이터 기준"]).astype({col: "Int64" for col in counts})
+
+def render_timing(started):
+    ms = (time.perf_counter() - started) * 1000
+    st.caption(f"⏱️ 화면 구성 {ms:.0f}ms" + (f" (목표 {RENDER_BUDGET_MS}ms 초과)" if ms > RENDER_BUDGET_MS else ""))
+
+def bus_riders_today(df, version, today_char):
+    with metrics.timer("pandas:bus_riders_today"):
+        schedule_days, _ = build_schedule_index(roster_key(version), df)
+        working_df = df.copy()
+        for col in SCHEDULE_COLS: working_df[col] = schedule_days[today_char][col]
         if '차량이용여부' in working_df.columns: working_df = working_df[working_df['차량이용여부'].fillna('O').astype(str).str.contains('O|이용|사용|오|ㅇ', case=False)]
-        
         if '등원요일' in working_df.columns:
             working_df = working_df[working_df['등원요일'].astype(str).str.strip().eq('') | working_df['등원요일'].astype(str).str.contains(today_char)]
+        return working_df
 
-        all_cars = sorted(list(set([x for x in working_df['등원차량'].unique().tolist() + working_df['하원차량'].unique().tolist() if x and str(x).strip() != ''])))
-        if all_cars:
-            selected_car = st.selectbox("배차 선택", all_cars)
-            schedule_list = []
-            for mode, v_col, t_col, l_col, c_col in [('등원', '등원차량', '등원시간', '등원장소', '등원확인'), ('하원', '하원차량', '하원시간', '하원장소', '하원확인')]:
-                for _, row in working_df[working_df[v_col] == selected_car].iterrows():
-                    schedule_list.append({'name': row['이름'], 'type': mode, 'time': row.get(t_col, ''), 'loc': row.get(l_col, ''), 'status': row.get(c_col, ''), 'check_col': c_col})
-            schedule_list.sort(key=lambda x: x['time'].strip() if x['time'] else "99:99")
-            
-            total = len(schedule_list)
-            done = len([x for x in schedule_list if x['status'] in ['탑승', '결석']])
-            st.progress(done/total if total > 0 else 0)
-            
-            curr_time = None
-            for idx, item in enumerate(schedule_list):
-                if item['time'] != curr_time:
-                    st.markdown("---")
-                    st.subheader(f"⏰ {item['time'] or '시간 미정'}")
-                    curr_time = item['time']
-                
-                bg, border, icon = ("#e3f2fd", "#2196f3", "🟦") if item['type'] == '등원' else ("#fff9c4", "#fbc02d", "🟨")
-                if item['status'] == '결석': bg, border = "#ffebee", "#ef5350"
-                
-                status_html = ""
-                if item['status'] == '탑승': status_html = "<span style='color:green;font-weight:bold;margin-left:10px;'>✅ 탑승완료</span>"
-                elif item['status'] == '결석': status_html = "<span style='color:red;font-weight:bold;margin-left:10px;'>❌ 결석</span>"
-                
-                st.markdown(f"<div style='background-color:{bg};padding:15px;border-left:6px solid {border};border-radius:8px;box-shadow:0 2px 4px rgba(0,0,0,0.1);margin-bottom:5px;color:black !important;'><div style='font-size:1.2rem;font-weight:bold;color:black;margin-bottom:5px;'>{icon} {item['name']} ({item['type']})</div><div style='font-size:1rem;color:#333;'>📍 {item['loc']} {status_html}</div></div>", unsafe_allow_html=True)
-                
-                c1, c2 = st.columns([1, 1])
-                key_base = f"{idx}_{item['name']}_{item['type']}"
-                with c1:
-                    if item['status'] == '탑승':
-                        if st.button("취소", key=f"u_{key_base}"): update_check_status(item['name'], item['check_col'], ''); st.rerun()
-                    else:
-                        if st.button("탑승", key=f"r_{key_base}"): update_check_status(item['name'], item['check_col'], '탑승'); st.rerun()
-                with c2:
-                    if item['status'] == '결석':
-                        if st.button("복구", key=f"ua_{key_base}"): update_check_status(item['name'], item['check_col'], ''); st.rerun()
-                    else:
-                        if st.button("결석", key=f"a_{key_base}"): update_check_status(item['name'], item['check_col'], '결석'); st.rerun()
-                st.write("")
-        else: st.info("운행 차량 없음")
-    else: st.error("데이터 로드 실패")
-
-# 3. 출석부
-elif menu == "📝 수련부 출석":
-    st.header("📝 수련부별 출석 체크")
-    if '수련부' in df_students.columns:
-        now = get_korea_time()
-        today_char = ["월", "화", "수", "목", "금", "토", "일"][now.weekday()]
-        
-        with st.container(border=True):
-            c_search, c_filter = st.columns([2, 1])
-            with c_search:
-                search_query = st.text_input("🔍 전체 원생 검색", placeholder="이름을 입력하면 수련부 상관없이 찾습니다.")
-            with c_filter:
-                class_list = sorted([str(x) for x in df_students['수련부'].dropna().unique() if str(x).strip() != ''])
-                if not search_query and class_list:
-                    selected_class = st.selectbox("수련 시간 선택", class_list)
-                    show_today = st.toggle(f"📅 오늘({today_char})만", value=True)
-                else: selected_class = None; show_today = False
-
-        target = pd.DataFrame()
-        title_text = ""
+def render_bus_route(selected_car, today_char):
+    working_df = bus_riders_today(*current_roster(), today_char)
+    schedule_list = []
+    for mode, v_col, t_col, l_col, c_col in [('등원', '등원차량', '등원시간', '등원장소', '등원확인'), ('하원', '하원차량', '하원시간', '하원장소', '하원확인')]:
+        for _, row in working_df[working_df[v_col] == selected_car].iterrows():
+            schedule_list.append({'name': row['이름'], 'key': row['_key'], 'type': mode, 'time': row.get(t_col, ''), 'loc': row.get(l_col, ''), 'status': row.get(c_col, ''), 'check_col': c_col})
+    schedule_list.sort(key=lambda x: x['time'].strip() if x['time'] else "99:99")
+
+    total = len(schedule_list)
+    done = len([x for x in schedule_list if x['status'] in ['탑승', '결석']])
+    st.progress(done/total if total > 0 else 0)
+    render_bulk_undo()
+
+    # 같은 시간/장소에서 아직 체크 안 된 아이들 (페이지와 상관없이 전체 목록 기준)
+    stops = collections.defaultdict(list)
+    for item in schedule_list:
+        if item['status'] not in ['탑승', '결석']: stops[(item['time'], item['loc'])].append(item)
+
+    start, end = page_bounds(total, f"bus_page_{selected_car}")
+    curr_time = None
+    for idx, item in enumerate(schedule_list[start:end], start):
+        if item['time'] != curr_time:
+            st.markdown("---")
+            st.subheader(f"⏰ {item['time'] or '시간 미정'}")
+            curr_time = item['time']
+            for (stop_time, loc), waiting in stops.items():
+                if stop_time != curr_time or len(waiting) < 2: continue
+                label = f"🚌 {loc or '장소 미정'} {len(waiting)}명 모두 탑승"
+                if st.button(label, key=f"bulk_{stop_time}_{loc}_{'|'.join(x['key'] for x in waiting)}"):
+                    bulk_update_status([(x['key'], x['check_col'], '탑승', {x['check_col']: x['status']}) for x in waiting], f"{stop_time} {loc} 탑승")
+                    rerun_section()
+
+        bg, border, icon = ("#e3f2fd", "#2196f3", "🟦") if item['type'] == '등원' else ("#fff9c4", "#fbc02d", "🟨")
+        if item['status'] == '결석': bg, border = "#ffebee", "#ef5350"
+
+        status_html = ""
+        if item['status'] == '탑승': status_html = "<span style='color:green;font-weight:bold;margin-left:10px;'>✅ 탑승완료</span>"
+        elif item['status'] == '결석': status_html = "<span style='color:red;font-weight:bold;margin-left:10px;'>❌ 결석</span>"
+
+        st.markdown(f"<div style='background-color:{bg};padding:15px;border-left:6px solid {border};border-radius:8px;box-shadow:0 2px 4px rgba(0,0,0,0.1);margin-bottom:5px;color:black !important;'><div style='font-size:1.2rem;font-weight:bold;color:black;margin-bottom:5px;'>{icon} {item['name']} ({item['type']})</div><div style='font-size:1rem;color:#333;'>📍 {item['loc']} {status_html}</div></div>", unsafe_allow_html=True)
+
+        c1, c2 = st.columns([1, 1])
+        key_base = f"{idx}_{item['name']}_{item['type']}_{item['status']}"
+        seen = {item['check_col']: item['status']}
+        with c1:
+            if item['status'] == '탑승':
+                if st.button("취소", key=f"u_{key_base}"): update_check_status(item['key'], item['check_col'], '', seen); rerun_section()
+            else:
+                if st.button("탑승", key=f"r_{key_base}"): update_check_status(item['key'], item['check_col'], '탑승', seen); rerun_section()
+        with c2:
+            if item['status'] == '결석':
+                if st.button("복구", key=f"ua_{key_base}"): update_check_status(item['key'], item['check_col'], '', seen); rerun_section()
+            else:
+                if st.button("결석", key=f"a_{key_base}"): update_check_status(item['key'], item['check_col'], '결석', seen); rerun_section()
+        st.write("")
+
+def render_attendance_table(target, key):
+    # 표 보기: 한 개의 data_editor (보이는 행만 그려짐). 바뀐 칸만 쓰기 대기열로 보냄
+    blank = pd.Series('', index=target.index)
+    notes = target['비고'].fillna('').astype(str) if '비고' in target.columns else blank
+    status = target['출석확인'] if '출석확인' in target.columns else blank
+    classes = target['수련부'].astype(str) if '수련부' in target.columns else blank
+    view = pd.DataFrame({'이름': target['이름'], '수련부': classes, '출석': status == '출석', '결석': status == '결석', '비고': notes.replace('nan', '')})
+    # 시트에 없는 열은 고칠 수 없게
+    locked = ['이름', '수련부'] + (['출석', '결석'] if '출석확인' not in target.columns else []) + (['비고'] if '비고' not in target.columns else [])
+    edited = st.data_editor(view, key=key, hide_index=True, use_container_width=True, disabled=locked)
+    changed = False
+    for i in edited.index[(edited != view).any(axis=1)]:
+        old, new = view.loc[i], edited.loc[i]
+        seen = target.loc[i]
+        if new['결석'] != old['결석']: update_check_status(seen['_key'], "출석확인", '결석' if new['결석'] else '', seen)
+        elif new['출석'] != old['출석']: update_check_status(seen['_key'], "출석확인", '출석' if new['출석'] else '', seen)
+        if new['비고'] != old['비고']: update_check_status(seen['_key'], "비고", new['비고'], seen)
+        changed = True
+    if changed:
+        st.session_state.att_table_rev = st.session_state.get('att_table_rev', 0) + 1  # 편집 상태를 비우고 새 스냅샷으로 다시 그림
+        rerun_section()
+
+def render_student_editor(i, row, note):
+    rev = row_rev(row)
+    t1, t2, t3, t4 = st.columns(4)
+    if t1.button("병결", key=f"s_{i}_{rev}"): update_check_status(row['_key'], "비고", "병결", row); rerun_section()
+    if t2.button("여행", key=f"t_{i}_{rev}"): update_check_status(row['_key'], "비고", "여행", row); rerun_section()
+    if t3.button("부상", key=f"h_{i}_{rev}"): update_check_status(row['_key'], "비고", "부상", row); rerun_section()
+    if t4.button("지움", key=f"d_{i}_{rev}"): update_check_status(row['_key'], "비고", "", row); rerun_section()
+
+    safe_note = note if str(note) != 'nan' else ""
+    new_note = st.text_input("사유 직접 입력", value=safe_note, key=f"n_{i}_{rev}")
+    if new_note != safe_note: update_check_status(row['_key'], "비고", new_note, row); rerun_section()
+
+    st.markdown("---")
+    st.caption("📅 장기 일정 (자동결석)")
+    d1, d2, d3 = st.columns([2,2,1])
+    s_d = d1.date_input("시작", key=f"sd_{i}", value=datetime.now())
+    e_d = d2.date_input("종료", key=f"ed_{i}", value=datetime.now())
+    r_l = st.text_input("사유", key=f"rl_{i}")
+    if d3.button("저장", key=f"sl_{i}_{rev}"):
+        if register_long_term_schedule(row['_key'], s_d, e_d, r_l, row): st.success("저장됨"); time.sleep(1); rerun_section()
+        else: st.error("실패")
+
+def render_attendance_cards(search_query, selected_class, show_today, today_char):
+    started = time.perf_counter()
+    df, version = current_roster()
+    target = pd.DataFrame()
+    title_text = ""
+    with metrics.timer("pandas:attendance_filter"):
         if search_query:
-            target = df_students[df_students['이름'].str.contains(search_query)]
+            target = df.loc[search_students(df, version, search_query)]
             title_text = f"🔍 '{search_query}' 검색 결과 ({len(target)}명)"
         elif selected_class:
-            target = df_students[df_students['수련부'].astype(str) == selected_class]
-            if show_today and '등원요일' in df_students.columns:
+            target = df[df['수련부'].astype(str) == selected_class]
+            if show_today and '등원요일' in df.columns:
                 target = target[target['등원요일'].astype(str).str.strip().eq('') | target['등원요일'].astype(str).str.contains(today_char)]
             title_text = f"🥋 {selected_class} ({len(target)}명)"
 
-        st.subheader(title_text)
-        if not target.empty:
-            for i, row in target.sort_values('이름').iterrows():
-                status = row.get('출석확인', '')
-                note = row.get('비고', '')
-                is_checked = (status == '출석')
-                
-                if status == '출석': card_bg, card_border, status_badge = "#e8f5e9", "#4caf50", "✅ 출석완료"
-                elif status == '결석': card_bg, card_border, status_badge = "#ffebee", "#ef5350", "❌ 결석처리"
-                else: card_bg, card_border, status_badge = "#ffffff", "#dddddd", ""
-
-                bus_in = parse_schedule_for_today(row.get('등원차량', ''), today_char)
-                bus_out = parse_schedule_for_today(row.get('하원차량', ''), today_char)
-                bus_txt = f"🚌 {bus_in} " if bus_in else ""
-                bus_txt += f"🏠 {bus_out}" if bus_out else ""
-                if not bus_txt: bus_txt = "도보/자차"
-                
-                note_html = f"<div style='margin-top:5px;padding:5px;background:#fff3cd;border-radius:4px;font-size:0.9em;'>📌 {note}</div>" if note and str(note) != 'nan' else ""
-                class_info = f"<span style='font-size:0.8em; color:gray; margin-left:5px;'>({row.get('수련부', '-')}부)</span>" if search_query else ""
-
-                st.markdown(f"""
-                <div style="background-color:{card_bg};border-left:5px solid {card_border};padding:12px;border-radius:5px;margin-top:15px;margin-bottom:5px;box-shadow:0 1px 3px rgba(0,0,0,0.1);color:black !important;">
-                    <div style="display:flex;justify-content:space-between;align-items:center;">
-                        <span style="font-size:1.3em;font-weight:bold;">{row['이름']} {class_info}</span>
-                        <span style="font-weight:bold;">{status_badge}</span>
-                    </div>
-                    <div style="font-size:0.9em;margin-top:5px;color:#555;">{bus_txt}</div>
-                    {note_html}
+    st.subheader(title_text)
+    render_bulk_undo()
+    if not target.empty:
+        if not search_query: target = target.sort_values('이름')  # 검색 결과는 순위 순서 그대로
+        remaining = target[target['출석확인'].fillna('').astype(str).str.strip() == ''] if '출석확인' in target.columns else target.iloc[:0]
+        if selected_class and not search_query and not remaining.empty:
+            # 아직 체크 안 된 원생만 (이미 출석/결석인 원생은 건드리지 않음). 키에 대상 목록을 넣어 옛 화면 클릭은 버림
+            b1, b2 = st.columns(2)
+            bulk_key = f"{title_text}_{'|'.join(remaining['_key'])}"
+            if b1.button(f"✅ 남은 {len(remaining)}명 모두 출석", key=f"bulk_att_{bulk_key}"):
+                bulk_update_status([(row['_key'], "출석확인", '출석', row) for _, row in remaining.iterrows()], f"{selected_class} 전체 출석"); rerun_section()
+            if b2.button(f"❌ 남은 {len(remaining)}명 결석처리", key=f"bulk_abs_{bulk_key}"):
+                bulk_update_status([(row['_key'], "출석확인", '결석', row) for _, row in remaining.iterrows()], f"{selected_class} 나머지 결석"); rerun_section()
+        if st.toggle("📋 표로 보기", value=len(target) > ROSTER_TABLE_AUTO):
+            # 표 내용이 다른 기기 때문에 바뀌면 키도 바뀌어서 옛 표에서 한 편집은 버려짐
+            rev = pd.util.hash_pandas_object(target[[c for c in DAY_CLOSE_COLS if c in target.columns]]).sum()
+            render_attendance_table(target, f"att_table_{title_text}_{st.session_state.get('att_table_rev', 0)}_{rev}")
+            render_timing(started)
+            return
+        today_schedule = build_schedule_index(roster_key(version), df)[0][today_char]
+        start, end = page_bounds(len(target), f"att_page_{title_text}")
+        for i, row in target.iloc[start:end].iterrows():
+            status = row.get('출석확인', '')
+            note = row.get('비고', '')
+            is_checked = (status == '출석')
+
+            if status == '출석': card_bg, card_border, status_badge = "#e8f5e9", "#4caf50", "✅ 출석완료"
+            elif status == '결석': card_bg, card_border, status_badge = "#ffebee", "#ef5350", "❌ 결석처리"
+            else: card_bg, card_border, status_badge = "#ffffff", "#dddddd", ""
+
+            bus_in = today_schedule.at[i, '등원차량']
+            bus_out = today_schedule.at[i, '하원차량']
+            bus_txt = f"🚌 {bus_in} " if bus_in else ""
+            bus_txt += f"🏠 {bus_out}" if bus_out else ""
+            if not bus_txt: bus_txt = "도보/자차"
+
+            note_html = f"<div style='margin-top:5px;padding:5px;background:#fff3cd;border-radius:4px;font-size:0.9em;'>📌 {note}</div>" if note and str(note) != 'nan' else ""
+            class_info = f"<span style='font-size:0.8em; color:gray; margin-left:5px;'>({row.get('수련부', '-')}부)</span>" if search_query else ""
+
+            st.markdown(f"""
+            <div style="background-color:{card_bg};border-left:5px solid {card_border};padding:12px;border-radius:5px;margin-top:15px;margin-bottom:5px;box-shadow:0 1px 3px rgba(0,0,0,0.1);color:black !important;">
+                <div style="display:flex;justify-content:space-between;align-items:center;">
+                    <span style="font-size:1.3em;font-weight:bold;">{row['이름']} {class_info}</span>
+                    <span style="font-weight:bold;">{status_badge}</span>
                 </div>
-                """, unsafe_allow_html=True)
-                
-                c1, c2 = st.columns([1, 1])
-                with c1:
-                    if st.checkbox("출석확인", value=is_checked, key=f"att_{i}_{row['이름']}"):
-                        if not is_checked: update_check_status(row['이름'], "출석확인", '출석'); st.rerun()
-                    else:
-                        if is_checked: update_check_status(row['이름'], "출석확인", ''); st.rerun()
-                with c2:
-                    if status == '결석':
-                        if st.button("결석취소", key=f"cncl_{i}"): update_check_status(row['이름'], "출석확인", ''); st.rerun()
-                    else:
-                        if st.button("결석처리", key=f"abs_{i}"): update_check_status(row['이름'], "출석확인", '결석'); st.rerun()
+                <div style="font-size:0.9em;margin-top:5px;color:#555;">{bus_txt}</div>
+                {note_html}
+            </div>
+            """, unsafe_allow_html=True)
+
+            rev = row_rev(row)
+            c1, c2 = st.columns([1, 1])
+            with c1:
+                if st.checkbox("출석확인", value=is_checked, key=f"att_{i}_{row['이름']}_{rev}"):
+                    if not is_checked: update_check_status(row['_key'], "출석확인", '출석', row); rerun_section()
+                else:
+                    if is_checked: update_check_status(row['_key'], "출석확인", '', row); rerun_section()
+            with c2:
+                if status == '결석':
+                    if st.button("결석취소", key=f"cncl_{i}_{rev}"): update_check_status(row['_key'], "출석확인", '', row); rerun_section()
+                else:
+                    if st.button("결석처리", key=f"abs_{i}_{rev}"): update_check_status(row['_key'], "출석확인", '결석', row); rerun_section()
+
+            # 특이사항 편집기는 펼친 원생 한 명만 만듦 (접힌 expander도 안의 위젯을 전부 만들기 때문)
+            editing = st.session_state.get('att_editor') == row['_key']
+            if st.button("🔼 닫기" if editing else "🔽 특이사항 / 장기 일정 등록", key=f"ed_toggle_{i}"):
+                st.session_state.att_editor = None if editing else row['_key']; rerun_section()
+            if editing:
+                with st.container(border=True): render_student_editor(i, row, note)
+        render_timing(started)
+    else:
+        if search_query: st.warning(f"'{search_query}' 검색 결과가 없습니다.")
+        else: st.info("수련 시간을 선택해주세요.")
+
+def render_absent_list():
+    df, version = current_roster()
+    absent = df[df['출석확인'] == '결석']
+    st.metric("총 결석", f"{len(absent)}명")
+    if not absent.empty: st.dataframe(absent[['이름', '수련부', '비고'] if '비고' in absent.columns else ['이름', '수련부']], hide_index=True, use_container_width=True)
+    else: st.success("결석자 없음 🎉")
+
+# ==========================================
+# UI 시작
+# ==========================================
+# 전체 실행 계측: st.rerun()/st.stop()/예외로 끝나도 실행을 닫음 (안 닫으면 이후 구역 실행이 전체 실행 안으로 잘못 잡힘)
+menu = None
+metrics_run, metrics_token = metrics.begin_run("전체")
+try:
+    with metrics.timer("run_daily_reconciliation"): run_daily_reconciliation()
+
+    with st.sidebar:
+        st.title("🥋 로운태권도")
+        st.markdown("**System Ver 74.0 (Fix & Retry)**")
+        st.write("---")
+        live_interval = None
+        if st.toggle("실시간 모드", value=False):
+            live_interval = st.select_slider("갱신 주기 (초)", options=LIVE_INTERVALS, value=LIVE_DEFAULT_INTERVAL)
+            st.caption(f"⚡ {live_interval}초마다 출석/차량 구역만 갱신 중...")
+        wq = get_write_queue().stats()
+        if wq["offline_since"]:
+            st.warning(f"📴 오프라인 {format_age(time.time() - wq['offline_since'])}째 · 기기에 저장된 변경 {wq['pending']}건 (연결되면 순서대로 반영)")
+        elif wq["pending"]: st.caption(f"✍️ 시트 반영 대기 {wq['pending']}건")
+        if wq["flushes"]: st.caption(f"⏱️ 최근 반영 {wq['last_latency_ms']}ms ({wq['last_batch_size']}칸) · 병합된 요청 {wq['coalesced']}건")
+        if wq["last_error"] and not wq["offline_since"]: st.caption(f"⚠️ 반영 재시도 중: {wq['last_error']}")
+        api = get_api_scheduler().stats()
+        if api["queued"] or sum(api["throttled"].values()) or api["retries"]:
+            st.caption(f"📶 API 대기 {api['queued']}건 · 한도 대기 {sum(api['throttled'].values())}회 · 재시도 {api['retries']}회")
+        if api["last_error"]: st.caption(f"⚠️ 최근 일시 오류: {api['last_error']}")
+        failures, conflicts = get_write_queue().notices(current_session_id())
+        for f in failures: st.error(f"❌ 시트 반영 실패로 {f['cells']}칸을 되돌렸습니다: {f['error']}")
+        for f in getattr(get_storage(), "parked", []):
+            if time.time() - f["time"] < 600: st.error(f"❌ 시트가 거부해서 보내지 못한 변경 ({f['sheet']} {f['method']}): {f['error']}")
+        for c in conflicts:
+            if c['current'] is None: st.warning(f"⚠️ {c['label']} {c['col']}: 명단에서 원생을 찾을 수 없어 '{c['value']}'(으)로 바꾸지 않았습니다")
+            else: st.warning(f"⚠️ {c['label']} {c['col']}: 다른 기기에서 '{c['current']}'(으)로 먼저 바꿔서 '{c['value']}'(으)로 바꾸지 않았습니다")
+        menu = st.radio("메뉴 선택", ["🏠 홈 대시보드", "🚍 차량 운행표", "📝 수련부 출석", "📞 학부모 상담", "📉 오늘의 결석자", "🧠 기질/훈육 통합", "📈 승급심사 관리", "🎂 이달의 생일", "🔐 관리자 모드"])
+        st.markdown("---")
+        if st.button("🔄 데이터 전체 새로고침"):
+            get_snapshot_loader().invalidate()
+            get_consultation_index().invalidate()
+            st.cache_data.clear()
+            st.rerun()
+
+    # 선택한 화면에 필요한 시트만 읽음 (나머지는 화면을 다 그린 뒤 백그라운드로 미리 읽기)
+    page_data, roster_version = load_page_data(menu)
+    render_data_status(PAGE_SHEETS.get(menu, ["원생명단"] + SLOW_SHEETS))
+    df_students, df_notice, df_guide, df_schedule = (page_data[name] for name in ["원생명단"] + SLOW_SHEETS)
+
+    # 1. 홈
+    if menu == "🏠 홈 대시보드":
+        now = get_korea_time()
+        st.markdown(f"<div style='text-align: right; font-size: 1.5em; font-weight: bold; margin-bottom: 20px;'>📅 {now.strftime('%m월 %d일')} {WEEKDAY_LABELS[now.weekday()]}</div>", unsafe_allow_html=True)
+        st.header("📢 오늘의 작전 브리핑")
+    
+        # 생일 알림
+        _, birthdays_by_date, _ = build_birthday_index(roster_key(roster_version), now.date(), df_students)
+        if birthdays_by_date:
+            today_birthdays = df_students.loc[df_students.index.intersection(birthdays_by_date.get((now.month, now.day), []))]
+            if not today_birthdays.empty:
+                names = today_birthdays['이름'].tolist()
+                st.success(f"🎂 **오늘 생일:** {', '.join(names)} 🎉 축하해주세요!")
+                st.balloons()
+
+        # 공지사항
+        if not df_notice.empty and len(df_notice.columns) >= 2:
+            recent_notices = df_notice.tail(10)
+            for i, row in recent_notices.iloc[::-1].iterrows():
+                content = str(row.iloc[1]).strip()
+                if not content: continue
+            
+                bg_color, border_color, icon = "#e8f5e9", "#4caf50", "✅"
+                if "[상담]" in content: bg_color, border_color, icon = "#ffebee", "#ef5350", "📞"
+                elif "[도복]" in content: bg_color, border_color, icon = "#e3f2fd", "#2196f3", "🥋"
+                elif "[심사]" in content or "심사" in content: bg_color, border_color, icon = "#fff9c4", "#fbc02d", "🏆"
                 
-                with st.expander("🔽 특이사항 / 장기 일정 등록"):
-                    t1, t2, t3, t4 = st.columns(4)
-                    if t1.button("병결", key=f"s_{i}"): update_check_status(row['이름'], "비고", "병결"); st.rerun()
-                    if t2.button("여행", key=f"t_{i}"): update_check_status(row['이름'], "비고", "여행"); st.rerun()
-                    if t3.button("부상", key=f"h_{i}"): update_check_status(row['이름'], "비고", "부상"); st.rerun()
-                    if t4.button("지움", key=f"d_{i}"): update_check_status(row['이름'], "비고", ""); st.rerun()
-                    
-                    safe_note = note if str(note) != 'nan' else ""
-                    new_note = st.text_input("사유 직접 입력", value=safe_note, key=f"n_{i}")
-                    if new_note != safe_note: update_check_status(row['이름'], "비고", new_note); st.rerun()
-                    
-                    st.markdown("---")
-                    st.caption("📅 장기 일정 (자동결석)")
-                    d1, d2, d3 = st.columns([2,2,1])
-                    s_d = d1.date_input("시작", key=f"sd_{i}", value=datetime.now())
-                    e_d = d2.date_input("종료", key=f"ed_{i}", value=datetime.now())
-                    r_l = st.text_input("사유", key=f"rl_{i}")
-                    if d3.button("저장", key=f"sl_{i}"):
-                        if register_long_term_schedule(row['이름'], s_d, e_d, r_l): st.success("저장됨"); time.sleep(1); st.rerun()
-                        else: st.error("실패")
-        else:
-            if search_query: st.warning(f"'{search_query}' 검색 결과가 없습니다.")
-            else: st.info("수련 시간을 선택해주세요.")
-    else: st.error("엑셀 로드 실패")
-
-# 4. 상담 로그
-elif menu == "📞 학부모 상담":
-    st.header("📞 학부모 상담 로그")
-    search_name_input = st.text_input("원생 이름 입력", placeholder="예: 김지안 (입력 후 엔터)")
-    if search_name_input:
-        if search_name_input in df_students['이름'].values:
-            search_name = search_name_input
+                st.markdown(f"""<div style="background-color: {bg_color}; border-left: 5px solid {border_color}; padding: 15px; border-radius: 8px; margin-bottom: 10px; color: black; box-shadow: 0 1px 2px rgba(0,0,0,0.1);"><div style="font-weight:bold; font-size:1.05em; margin-bottom:5px;">{icon} 공지</div><div style="white-space: pre-wrap;">{content}</div></div>""", unsafe_allow_html=True)
+        else: st.info("등록된 공지사항이 없습니다.")
+        st.markdown("---")
+        if not df_schedule.empty:
+            today_test = df_schedule[pd.to_datetime(df_schedule.iloc[:,0].astype(str).str.replace('.','-'), errors='coerce').dt.date == now.date()]
+            if not today_test.empty:
+                st.error(f"🔥 **오늘 승급심사: {len(today_test)}명**")
+                for i, row in today_test.iterrows(): st.write(f" - {row.iloc[1]}")
+            else: st.success("✅ 오늘 예정된 심사는 없습니다.")
+
+    # 2. 차량
+    elif menu == "🚍 차량 운행표":
+        st.header("🚍 실시간 통합 운행표")
+        now = get_korea_time()
+        today_char = WEEKDAY_CHARS[now.weekday()]
+        st.caption(f"📅 **오늘({today_char}요일)** 기준 리스트")
+        if not df_students.empty:
+            schedule_problems = build_schedule_index(roster_key(roster_version), df_students)[1]
+            if not schedule_problems.empty:
+                with st.expander(f"⚠️ 해석할 수 없는 차량 일정 {len(schedule_problems)}건"):
+                    st.dataframe(schedule_problems, hide_index=True, use_container_width=True)
+            working_df = bus_riders_today(df_students, roster_version, today_char)
+            all_cars = sorted(list(set([x for x in working_df['등원차량'].unique().tolist() + working_df['하원차량'].unique().tolist() if x and str(x).strip() != ''])))
+            if all_cars:
+                selected_car = st.selectbox("배차 선택", all_cars)
+                live_section(render_bus_route)(selected_car, today_char)
+            else: st.info("운행 차량 없음")
+        else: st.error("데이터 로드 실패")
+
+    # 3. 출석부
+    elif menu == "📝 수련부 출석":
+        st.header("📝 수련부별 출석 체크")
+        if '수련부' in df_students.columns:
+            now = get_korea_time()
+            today_char = WEEKDAY_CHARS[now.weekday()]
+        
             with st.container(border=True):
-                st.subheader(f"📝 {search_name} 상담 기록 작성")
-                new_log = st.text_area("상담 내용", height=100)
-                if st.button("기록 저장"):
-                    if new_log:
-                        if add_consultation_log(search_name, new_log): st.success("저장되었습니다."); time.sleep(1); st.rerun()
-                        else: st.error("실패")
-                    else: st.warning("내용 입력 필요")
-            st.markdown("---")
-            st.subheader(f"🗂️ {search_name} 히스토리")
-            logs = load_consultation_logs(search_name)
-            if not logs.empty:
-                for idx, row in logs.iterrows():
-                    with st.chat_message("user"):
-                        st.write(f"**{row['날짜']}**")
-                        st.write(row['내용'])
-            else: st.info("기록 없음")
-        else: st.error(f"'{search_name_input}' 원생을 찾을 수 없습니다.")
-    else: st.info("이름을 입력하면 상담 기록이 나타납니다.")
-
-# 5. 결석자
-elif menu == "📉 오늘의 결석자":
-    st.header("📉 오늘의 결석 현황")
-    if '출석확인' in df_students.columns:
-        absent = df_students[df_students['출석확인'] == '결석']
-        st.metric("총 결석", f"{len(absent)}명")
-        if not absent.empty: st.dataframe(absent[['이름', '수련부', '비고'] if '비고' in absent.columns else ['이름', '수련부']], hide_index=True, use_container_width=True)
-        else: st.success("결석자 없음 🎉")
-
-# 6. 기질/훈육
-elif menu == "🧠 기질/훈육 통합":
-    st.header("🧠 훈육 가이드")
-    name = st.text_input("이름 검색")
-    if name:
-        res = df_students[df_students['이름'] == name]
-        if not res.empty:
-            row = res.iloc[0]
-            gtype = row.get('기질유형', '미검사')
-            st.subheader(f"{name} ({gtype})")
-            if gtype != '미검사' and not df_guide.empty:
-                guide = df_guide[df_guide['기질유형'] == gtype]
-                if not guide.empty:
-                    gr = guide.iloc[0]
-                    st.info(f"DO: {gr.get('지도_DO(해라)', '-')}"); st.warning(f"DON'T: {gr.get('지도_DONT(하지마라)', '-')}")
-                    with st.expander("스크립트"): st.text(gr.get('훈육_스크립트', ''))
-        else: st.error("없음")
-
-# 7. 승급심사
-elif menu == "📈 승급심사 관리":
-    st.header("📈 승급심사")
-    if not df_schedule.empty: st.dataframe(df_schedule, hide_index=True, use_container_width=True)
-
-# 8. 생일
-elif menu == "🎂 이달의 생일":
-    kst_now = get_korea_time()
-    this_month = kst_now.month
-    st.header("🎂 이달의 생일자")
-    st.subheader(f"{this_month}월의 주인공 🎉")
+                c_search, c_filter = st.columns([2, 1])
+                with c_search:
+                    search_query = st.text_input("🔍 전체 원생 검색", placeholder="이름을 입력하면 수련부 상관없이 찾습니다.")
+                with c_filter:
+                    class_list = sorted([str(x) for x in df_students['수련부'].dropna().unique() if str(x).strip() != ''])
+                    if not search_query and class_list:
+                        selected_class = st.selectbox("수련 시간 선택", class_list)
+                        show_today = st.toggle(f"📅 오늘({today_char})만", value=True)
+                    else: selected_class = None; show_today = False
+
+            live_section(render_attendance_cards)(search_query, selected_class, show_today, today_char)
+        else: st.error("엑셀 로드 실패")
+
+    # 4. 상담 로그
+    elif menu == "📞 학부모 상담":
+        st.header("📞 학부모 상담 로그")
+        search_name_input = st.text_input("원생 이름 입력", placeholder="예: 김지안, 김지, ㄱㅈㅇ (입력 후 엔터)")
+        if search_name_input:
+            picked = pick_student(df_students, roster_version, search_name_input, "consult_pick")
+            if picked is not None:
+                search_name = df_students.at[picked, '이름']
+                with st.container(border=True):
+                    st.subheader(f"📝 {search_name} 상담 기록 작성")
+                    new_log = st.text_area("상담 내용", height=100)
+                    if st.button("기록 저장"):
+                        if new_log:
+                            if add_consultation_log(search_name, new_log): st.success("저장되었습니다."); time.sleep(1); st.rerun()
+                            else: st.error("실패")
+                        else: st.warning("내용 입력 필요")
+                st.markdown("---")
+                st.subheader(f"🗂️ {search_name} 히스토리")
+                logs = load_consultation_logs(search_name)
+                if not logs.empty:
+                    for idx, row in logs.iterrows():
+                        with st.chat_message("user"):
+                            st.write(f"**{row['날짜']}**")
+                            st.write(row['내용'])
+                else: st.info("기록 없음")
+            else: st.error(f"'{search_name_input}' 원생을 찾을 수 없습니다.")
+        else: st.info("이름을 입력하면 상담 기록이 나타납니다.")
+
+    # 5. 결석자
+    elif menu == "📉 오늘의 결석자":
+        st.header("📉 오늘의 결석 현황")
+        if '출석확인' in df_students.columns: live_section(render_absent_list)()
+
+    # 6. 기질/훈육
+    elif menu == "🧠 기질/훈육 통합":
+        st.header("🧠 훈육 가이드")
+        query = st.text_input("이름 검색", placeholder="예: 김지안, 김지, ㄱㅈㅇ")
+        if query:
+            picked = pick_student(df_students, roster_version, query, "guide_pick")
+            if picked is not None:
+                row = df_students.loc[picked]
+                name = row['이름']
+                gtype = row.get('기질유형', '미검사')
+                st.subheader(f"{name} ({gtype})")
+                if gtype != '미검사' and not df_guide.empty:
+                    guide = df_guide[df_guide['기질유형'] == gtype]
+                    if not guide.empty:
+                        gr = guide.iloc[0]
+                        st.info(f"DO: {gr.get('지도_DO(해라)', '-')}"); st.warning(f"DON'T: {gr.get('지도_DONT(하지마라)', '-')}")
+                        with st.expander("스크립트"): st.text(gr.get('훈육_스크립트', ''))
+            else: st.error("없음")
+
+    # 7. 승급심사
+    elif menu == "📈 승급심사 관리":
+        st.header("📈 승급심사")
+        if not df_schedule.empty: st.dataframe(df_schedule, hide_index=True, use_container_width=True)
+
+    # 8. 생일
+    elif menu == "🎂 이달의 생일":
+        kst_now = get_korea_time()
+        this_month = kst_now.month
+        st.header("🎂 이달의 생일자")
+        st.subheader(f"{this_month}월의 주인공 🎉")
     
-    birth_cols = [c for c in df_students.columns if '생일' in c or '생년' in c]
-    if birth_cols:
-        target_col = birth_cols[0]
-        df_birth = df_students[df_students[target_col].astype(str).str.strip() != '']
-        df_birth['birth_month'] = df_birth[target_col].apply(extract_birth_month)
-        df_birth['birth_day'] = df_birth[target_col].apply(extract_birth_day)
-        
-        b_kids = df_birth[df_birth['birth_month'] == this_month]
-        if not b_kids.empty:
-            st.balloons()
-            b_kids = b_kids.sort_values(by=['birth_day', '이름'])
-            for i, row in b_kids.iterrows():
-                w_day = get_birthday_weekday(this_month, row['birth_day'])
-                info_txt = f"🎂 **{row['birth_day']}일 {w_day} - {row['이름']}**"
-                if '수련부' in row: info_txt += f" ({row['수련부']}부)"
-                st.info(info_txt)
-        else: st.write(f"{this_month}월 생일자가 없습니다.")
-    else: st.error(f"엑셀에 '생일' 컬럼이 없습니다.")
-
-# 9. 관리자
-elif menu == "🔐 관리자 모드":
-    st.header("관리자")
-    if st.text_input("PW", type="password") == "0577":
-        st.success("승인됨")
-        st.markdown("---")
+        birthdays, _, birthdays_by_month = build_birthday_index(roster_key(roster_version), kst_now.date(), df_students)
+        if birthdays is not None:
+            month_idx = df_students.index.intersection(birthdays_by_month.get(this_month, []))
+            b_kids = df_students.loc[month_idx].join(birthdays.loc[month_idx])
+            if not b_kids.empty:
+                st.balloons()
+                b_kids = b_kids.sort_values(by=['birth_day', '이름'])
+                for i, row in b_kids.iterrows():
+                    info_txt = f"🎂 **{row['birth_day']}일 {row['birth_weekday']} - {row['이름']}**"
+                    if '수련부' in row: info_txt += f" ({row['수련부']}부)"
+                    st.info(info_txt)
+            else: st.write(f"{this_month}월 생일자가 없습니다.")
+        else: st.error(f"엑셀에 '생일' 컬럼이 없습니다.")
+
+    # 9. 관리자
+    elif menu == "🔐 관리자 모드":
+        st.header("관리자")
+        if st.text_input("PW", type="password") == "0577":
+            st.success("승인됨")
+            st.markdown("---")
         
-        tab1, tab2 = st.tabs(["📢 공지사항 등록", "🔥 하루 마감"])
+            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📢 공지사항 등록", "🔥 하루 마감", "📅 장기일정 반영", "📊 출석 통계", "⏱️ 성능", "🏢 지점 현황"])
         
-        with tab1:
-            st.subheader("새로운 공지사항 등록")
-            st.info("💡 테마를 선택하고 내용을 입력하면, 홈 화면에 색상 카드로 표시됩니다.")
-            notice_theme = st.radio("테마 선택", ["일반(초록)", "상담(빨강)", "도복(파랑)", "심사(노랑)"], horizontal=True)
-            notice_content = st.text_area("공지 내용 입력", height=150)
+            with tab1:
+                st.subheader("새로운 공지사항 등록")
+                st.info("💡 테마를 선택하고 내용을 입력하면, 홈 화면에 색상 카드로 표시됩니다.")
+                notice_theme = st.radio("테마 선택", ["일반(초록)", "상담(빨강)", "도복(파랑)", "심사(노랑)"], horizontal=True)
+                notice_content = st.text_area("공지 내용 입력", height=150)
             
-            if st.button("공지 올리기"):
-                if notice_content:
-                    prefix = ""
-                    if "상담" in notice_theme: prefix = "[상담] "
-                    elif "도복" in notice_theme: prefix = "[도복] "
-                    elif "심사" in notice_theme: prefix = "[심사] "
+                if st.button("공지 올리기"):
+                    if notice_content:
+                        prefix = ""
+                        if "상담" in notice_theme: prefix = "[상담] "
+                        elif "도복" in notice_theme: prefix = "[도복] "
+                        elif "심사" in notice_theme: prefix = "[심사] "
                     
-                    final_msg = prefix + notice_content
+                        final_msg = prefix + notice_content
                     
-                    if add_notice_to_sheet(final_msg):
-                        st.success("공지가 등록되었습니다! (홈 화면에서 확인하세요)")
-                        load_slow_data.clear() # 캐시 초기화
-                        time.sleep(1)
-                        st.rerun()
-                    else: st.error("등록 실패")
-                else: st.warning("내용을 입력해주세요.")
+                        if add_notice_to_sheet(final_msg):
+                            st.success("공지가 등록되었습니다! (홈 화면에서 확인하세요)")
+                            get_snapshot_loader().invalidate("공지사항") # 캐시 초기화
+                            time.sleep(1)
+                            st.rerun()
+                        else: st.error("등록 실패")
+                    else: st.warning("내용을 입력해주세요.")
                     
-        with tab2:
-            st.subheader("하루 마감 (출석부 저장 및 초기화)")
-            st.warning("⚠️ 주의: 이 버튼을 누르면 오늘의 출석 기록이 '월간출석부'로 넘어가고, 현재 화면은 초기화됩니다.")
-            if st.button("🔥 마감 및 저장"):
-                with st.spinner("저장 중..."):
-                    ok, msg = archive_daily_attendance()
-                if ok:
-                    st.success(msg)
-                    with st.spinner("초기화 중..."):
-                        try:
-                            c = get_gspread_client()
-                            ws = c.open_by_key(SHEET_ID).worksheet("원생명단")
-                            headers = ws.row_values(1)
-                            ranges = []
-                            for col_name in ["등원확인", "하원확인", "출석확인", "비고"]:
-                                if col_name in headers:
-                                    col_idx = headers.index(col_name) + 1
-                                    col_letter = gspread.utils.rowcol_to_a1(1, col_idx).replace('1', '')
-                                    ranges.append(f"{col_letter}2:{col_letter}1000")
-                            if ranges: 
-                                ws.batch_clear(ranges)
-                                st.success("완료! 👋")
-                                load_fast_data.clear()
-                                time.sleep(2)
-                                st.rerun()
-                        except: st.error("초기화 실패")
-                else: st.error(msg)
+            with tab2:
+                st.subheader("하루 마감 (출석부 저장 및 초기화)")
+                st.warning("⚠️ 주의: 이 버튼을 누르면 오늘의 출석 기록이 '월간출석부'로 넘어가고, 현재 화면은 초기화됩니다.")
+                if st.button("🔥 마감 및 저장"):
+                    with st.spinner("저장 및 초기화 중..."):
+                        ok, msg = archive_daily_attendance()
+                    if ok: st.success(msg)
+                    else: st.error(msg)
+
+            with tab3:
+                st.subheader("장기일정 일괄 반영")
+                st.info("💡 매일 첫 접속 시 자동으로 실행됩니다. (만료 일정 삭제 + 기간 중 자동 결석)")
+                state = get_reconcile_state()
+                if state["date"]: st.caption(f"마지막 자동 반영: {state['date']} - {state['message']}")
+                if st.button("📅 지금 반영"):
+                    with st.spinner("반영 중..."):
+                        ok, msg = reconcile_long_term_schedules()
+                    if ok: st.success(msg)
+                    else: st.error(msg)
+
+            with tab4:
+                st.subheader("출석 이력 통계")
+                st.caption("💡 하루 마감 때마다 로컬 이력 저장소에 쌓인 기록으로 계산합니다.")
+                period = st.selectbox("기간", [30, 90, 180, 365], index=1, format_func=lambda d: f"최근 {d}일")
+                start = time.perf_counter()
+                frame = get_attendance_history().frame(period, get_korea_time().date())
+                if frame.empty: st.info("저장된 출석 이력이 없습니다.")
+                else:
+                    rates, streaks, trend = class_attendance_rates(frame), student_streaks(frame), absence_trend(frame)
+                    st.caption(f"⏱️ 기록 {len(frame)}건 계산 {(time.perf_counter() - start) * 1000:.1f}ms")
+                    st.markdown("**수련부별 출석률**")
+                    st.dataframe(rates, hide_index=True, use_container_width=True)
+                    st.markdown("**결석 추이**")
+                    st.line_chart(trend)
+                    st.markdown("**원생별 연속 출석**")
+                    st.dataframe(streaks, hide_index=True, use_container_width=True)
+
+            with tab5:
+                st.subheader("성능 계측")
+                st.caption("💡 이 서버가 켜진 뒤의 기록입니다. 시트 API 호출, 캐시 적중, 데이터 로드/필터/구역 구성 시간을 모읍니다.")
+                m1, m2, m3 = st.columns(3)
+                per_minute = metrics.api_per_minute()
+                m1.metric("API 호출 (최근 1분)", int(per_minute.iloc[-1]))
+                m2.metric("API 호출 (30분 평균/분)", f"{per_minute.mean():.1f}")
+                m3.metric("기록된 실행", len(metrics.runs))
+                st.markdown("**분당 시트 API 호출**")
+                st.bar_chart(per_minute)
+                st.markdown("**항목별 지연 (p50 / p95)**")
+                st.dataframe(metrics.summary(), hide_index=True, use_container_width=True)
+                st.markdown("**캐시 적중률**")
+                st.dataframe(metrics.cache_ratios(), hide_index=True, use_container_width=True)
+                st.markdown("**최근 실행별 구간 시간 (ms)**")
+                runs = list(metrics.runs)[-30:][::-1]
+                if runs:
+                    breakdown = pd.DataFrame([{"시각": (datetime.utcfromtimestamp(r["time"]) + timedelta(hours=9)).strftime("%H:%M:%S"),
+                                               "실행": r["label"], "전체": r["total_ms"], **r["parts"]} for r in runs]).fillna(0)
+                    st.dataframe(breakdown, hide_index=True, use_container_width=True)
+                e1, e2, e3 = st.columns(3)
+                e1.download_button("⬇️ JSON 내보내기", metrics.export_json(), file_name="roun_metrics.json", mime="application/json")
+                e2.download_button("⬇️ CSV 내보내기", metrics.export_csv(), file_name="roun_metrics.csv", mime="text/csv")
+                if e3.button("🧹 기록 초기화"): metrics.reset(); st.rerun()
+
+            with tab6:
+                st.subheader("지점별 현황")
+                st.caption("💡 각 지점에 이미 불러와 둔 스냅샷 기준입니다 (시트를 새로 읽지 않음). 한 번도 열지 않은 지점은 '아직 안 열림'으로 표시합니다.")
+                summary = branch_summary()
+                s1, s2, s3 = st.columns(3)
+                s1.metric("전체 재원", int(summary["재원"].sum()))
+                s2.metric("전체 출석", int(summary["출석"].sum()))
+                s3.metric("전체 결석", int(summary["결석"].sum()))
+                st.dataframe(summary, hide_index=True, use_container_width=True)
+
+    prefetch_other_pages(menu)
+finally:
+    metrics.end_run(metrics_run, metrics_token, f"전체:{menu}" if menu else None)